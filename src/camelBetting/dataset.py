@@ -0,0 +1,184 @@
+"""Module containing the generator of labelled position datasets stored in memory-mapped NumPy files."""
+from camelBetting.entities.board import Board, CAMELS
+from camelBetting.entities.move import StonePut
+from camelBetting.entities.player import RandomNpc, LessRandomNpc, RollerNpc
+from camelBetting.features import board_features, rank_probabilities, N_FIELDS, FEATURE_SIZE, LABEL_SIZE
+from camelBetting.game import Game
+from camelBetting.simulation import Simulation
+from camelBetting.tools import block_stdout, enable_stdout
+
+import json
+import multiprocessing
+import os
+import random
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+SOURCES = ['self_play', 'random']
+
+
+def self_play_positions(n_positions: int, rng: Union[random.Random, None] = None) -> List[Board]:
+    """Positions from games of cheap NPCs.
+
+    Args:
+        n_positions: number of positions
+        rng: random generator of the games and the choice of the positions, the global one if None
+
+    Returns:
+        boards of running games
+    """
+    rng = random if rng is None else rng
+    positions = []
+    while len(positions) < n_positions:
+        game = Game([
+            RandomNpc('Silly Guy', threshold_for_overall_bets=8, rng=rng),
+            LessRandomNpc('Less Random Guy', threshold_for_overall_bets=8, rng=rng),
+            RollerNpc('High Roller', rng=rng),
+        ], rng=rng)
+        game.play()
+        positions += [board for board in game.history if not board.game_ended]
+    return rng.sample(positions, n_positions)
+
+
+def random_position(rng: Union[random.Random, None] = None) -> Board:
+    """Random valid position - camels stacked on random fields, random stones and random camels left to roll.
+
+    Args:
+        rng: random generator of the position, the global one if None
+
+    Returns:
+        random board
+    """
+    rng = random if rng is None else rng
+    board = Board(['a', 'b'])
+    for camel in rng.sample(CAMELS, len(CAMELS)):
+        board.move_camel(camel, rng.randint(1, 14), True)
+    for player in board.players:
+        free_fields = [field for field in range(2, N_FIELDS)
+                       if StonePut(board, board.current_player, field, True).available]
+        if rng.random() < 0.5 and len(free_fields) > 0:
+            board = StonePut(board, player, rng.choice(free_fields), rng.random() < 0.5).play(True)
+        else:
+            board.next_player()
+    board.camels_to_roll = rng.sample(CAMELS, rng.randint(1, len(CAMELS)))
+    return board
+
+
+def generate_chunk(
+        chunk_index: int, chunk_size: int, source: str, number_of_approximations: int, seed: int
+) -> Tuple[int, np.ndarray, np.ndarray]:
+    """Generate and label one chunk of positions.
+
+    The chunk only depends on its index and the seed - it draws from its own random generator and leaves the
+    global one alone - so an interrupted generation can be resumed.
+
+    Args:
+        chunk_index: index of the chunk
+        chunk_size: number of positions in the chunk
+        source: 'self_play' or 'random'
+        number_of_approximations: number of rollouts labelling a position
+        seed: seed of the dataset
+
+    Returns:
+        chunk index, features and labels of the chunk
+    """
+    rng = random.Random(seed * 1000003 + chunk_index)
+    block_stdout()
+    if source == 'self_play':
+        positions = self_play_positions(chunk_size, rng)
+    else:
+        positions = [random_position(rng) for _ in range(chunk_size)]
+    features = np.stack([board_features(board) for board in positions])
+    labels = np.stack([rank_probabilities(Simulation(board, rng=rng).approximate_game(number_of_approximations))
+                       for board in positions])
+    enable_stdout()
+    return chunk_index, features, labels
+
+
+def _generate_chunk(args: Tuple) -> Tuple[int, np.ndarray, np.ndarray]:
+    """Pool wrapper of generate_chunk."""
+    return generate_chunk(*args)
+
+
+def generate_dataset(
+        path: str,
+        n_positions: int,
+        chunk_size: int = 1000,
+        source: str = 'self_play',
+        number_of_approximations: int = 200,
+        workers: Union[int, None] = None,
+        seed: int = 0,
+) -> None:
+    """Generate a dataset of labelled positions into memory-mapped files, resuming an interrupted generation.
+
+    The directory gets features.npy (n_positions x FEATURE_SIZE), labels.npy (n_positions x LABEL_SIZE) and
+    progress.json with the generation parameters and the finished chunks. Only the chunks in flight are held
+    in memory.
+
+    Args:
+        path: directory of the dataset
+        n_positions: number of positions
+        chunk_size: number of positions generated by one worker task
+        source: 'self_play' for positions from NPC games or 'random' for random valid boards
+        number_of_approximations: number of rollouts labelling a position
+        workers: number of worker processes, number of CPUs if None
+        seed: seed of the dataset
+    """
+    if source not in SOURCES:
+        raise ValueError(f'Invalid position source: {source}')
+    os.makedirs(path, exist_ok=True)
+    progress_path = os.path.join(path, 'progress.json')
+    parameters = {'n_positions': n_positions, 'chunk_size': chunk_size, 'source': source,
+                  'number_of_approximations': number_of_approximations, 'seed': seed}
+    if os.path.exists(progress_path):
+        with open(progress_path) as f:
+            progress = json.load(f)
+        if progress['parameters'] != parameters:
+            raise ValueError(f'Dataset in {path} was generated with different parameters: {progress["parameters"]}')
+        mode = 'r+'
+    else:
+        progress = {'parameters': parameters, 'done': []}
+        mode = 'w+'
+    features = open_memmap(os.path.join(path, 'features.npy'), mode=mode, dtype=np.float32,
+                           shape=(n_positions, FEATURE_SIZE))
+    labels = open_memmap(os.path.join(path, 'labels.npy'), mode=mode, dtype=np.float32,
+                         shape=(n_positions, LABEL_SIZE))
+    if mode == 'w+':
+        _save_progress(progress_path, progress)
+
+    n_chunks = (n_positions + chunk_size - 1) // chunk_size
+    tasks = [(i, min(chunk_size, n_positions - i * chunk_size), source, number_of_approximations, seed)
+             for i in range(n_chunks) if i not in progress['done']]
+    with multiprocessing.Pool(workers) as pool:
+        for chunk_index, chunk_features, chunk_labels in pool.imap_unordered(_generate_chunk, tasks):
+            start = chunk_index * chunk_size
+            features[start:start + len(chunk_features)] = chunk_features
+            labels[start:start + len(chunk_labels)] = chunk_labels
+            features.flush()
+            labels.flush()
+            progress['done'].append(chunk_index)
+            _save_progress(progress_path, progress)
+
+
+def load_dataset(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Open a generated dataset without loading it into memory.
+
+    Args:
+        path: directory of the dataset
+
+    Returns:
+        read-only memory-mapped features and labels
+    """
+    features = np.load(os.path.join(path, 'features.npy'), mmap_mode='r')
+    labels = np.load(os.path.join(path, 'labels.npy'), mmap_mode='r')
+    return features, labels
+
+
+def _save_progress(progress_path: str, progress: Dict) -> None:
+    """Atomically save the generation progress."""
+    tmp_path = progress_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, progress_path)
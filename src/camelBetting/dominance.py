@@ -0,0 +1,141 @@
+"""Module containing the checks of race outcomes that are decided before the race is played out."""
+from camelBetting.entities.board import Board
+
+from typing import List, Tuple, Union
+
+
+def max_step(board: Board) -> int:
+    """Maximal number of fields a camel can move forward in one roll.
+
+    Args:
+        board: current board
+
+    Returns:
+        maximal step
+    """
+    return 4 if any([stone.value > 0 for stone in board.stones.values()]) else 3
+
+
+def game_can_end_within(board: Board, rolls: int) -> bool:
+    """Whether the game can end within a number of rolls.
+
+    Args:
+        board: current board
+        rolls: number of rolls
+
+    Returns:
+        False if no camel can get past field 16 in the rolls
+    """
+    return max([f for f, i in board.camel_positions.values()]) + rolls * max_step(board) > 16
+
+
+def game_ends_in_etape(board: Board) -> bool:
+    """Whether the game surely ends before the end of the etape.
+
+    Args:
+        board: current board
+
+    Returns:
+        True if a camel that has not rolled yet gets past field 16 with any dice
+    """
+    for camel in board.camels_to_roll:
+        field = board.camel_positions[camel][0]
+        # the shortest roll gets to field + 1, or back to field by a minus stone there
+        if field >= 16 or field == 15 and field + 1 in board.stones and board.stones[field + 1].value > 0:
+            return True
+    return False
+
+
+def etape_order_decided(board: Board) -> Union[Tuple[str], None]:
+    """Camel order if the remaining rolls of the etape cannot change it.
+
+    A camel behind another one cannot overtake it if it cannot move at all - no camel under it is left to roll
+    and no camel can be put under it by a minus stone - or if it cannot reach the field of the camel in front of
+    it even when moving the maximal step in every remaining roll. Camels never move backwards, so this holds
+    for every adjacent pair and for every prefix of the remaining rolls.
+
+    Args:
+        board: current board
+
+    Returns:
+        the current camel order if it is decided, None otherwise
+    """
+    if len(board.camels_to_roll) == 1:
+        return board.current_camel_order if _last_roll_keeps_order(board) else None
+    order = board.current_camel_order
+    reach = len(board.camels_to_roll) * max_step(board)
+    for ahead, behind in zip(order[:-1], order[1:]):
+        field, height = board.camel_positions[behind]
+        if field + reach < board.camel_positions[ahead][0]:
+            continue
+        if not _frozen(board, behind, field, height):
+            return None
+    return order
+
+
+def independent_groups(board: Board) -> List[List[str]]:
+    """Split the camels into groups that cannot reach each other in the rest of the etape.
+
+    A group starts wherever a camel cannot reach the field of the camel in front of it even when moving the
+    maximal step in every remaining roll. The rolls of one group then never move the camels of another one.
+
+    Args:
+        board: current board
+
+    Returns:
+        groups of camels in the current order, from the leading group
+    """
+    order = board.current_camel_order
+    reach = len(board.camels_to_roll) * max_step(board)
+    groups = [[order[0]]]
+    for ahead, behind in zip(order[:-1], order[1:]):
+        if board.camel_positions[behind][0] + reach < board.camel_positions[ahead][0]:
+            groups.append([])
+        groups[-1].append(behind)
+    return groups
+
+
+def _last_roll_keeps_order(board: Board) -> bool:
+    """Whether the roll of the last camel left to roll keeps the camel order with any dice."""
+    camel = board.camels_to_roll[0]
+    field, height = board.camel_positions[camel]
+    farthest = field
+    minus_stone = False
+    minus_next = field + 1 in board.stones and board.stones[field + 1].value < 0
+    for dice in [1, 2, 3]:
+        landing = field + dice
+        if landing in board.stones:
+            minus_stone = minus_stone or board.stones[landing].value < 0
+            landing += board.stones[landing].value
+        farthest = max(farthest, landing)
+    party = 1
+    for other, (f, i) in board.camel_positions.items():
+        if other == camel:
+            continue
+        if f == field:
+            if field == 0:
+                return False
+            if i > height:
+                party += 1
+            elif minus_next:
+                # the minus stone on the next field puts the camel under the ones below it
+                return False
+        elif field < f <= farthest:
+            return False
+    # a travelling party put under a field by a minus stone gets reversed
+    return not minus_stone or party == 1
+
+
+def _frozen(board: Board, camel: str, field: int, height: int) -> bool:
+    """Whether the camel surely stays where it is for the rest of the etape."""
+    if field == 0:
+        # camels on the start move one by one
+        return camel not in board.camels_to_roll
+    next_stone = board.stones.get(field + 1)
+    if next_stone is not None and next_stone.value < 0:
+        return False
+    for other in board.camels_to_roll:
+        f, i = board.camel_positions[other]
+        if f == field and i <= height:
+            return False
+    return True
@@ -6,10 +6,23 @@ from typing import List, Tuple, Union, Dict
 from copy import copy
 
 CAMELS = ['yellow', 'blue', 'green', 'orange', 'white']
+# containers of the board that can be shared between board versions - write them only through Board._writable
+SHARED_FIELDS = ('camels_to_roll', 'available_etape_bets', 'winning_bets', 'losing_bets', 'stones',
+                 'camel_positions', 'player_banks', 'player_etape_bets', 'player_camel_cards')
 
 
 class Board:
-    """Board class."""
+    """Board class.
+
+    Copies of the board are persistent versions sharing their containers (see SHARED_FIELDS) with the
+    original. A container is copied only when one of the versions writes to it (see _writable), and the lists
+    inside the dicts are never changed in place but replaced, so a move costs only the containers it changes.
+
+    A container that may be shared must not be changed in place (e.g. board.camel_positions[camel] = ... or
+    board.camels_to_roll.remove(camel)) - the change would silently show in the other versions, the boards of
+    the game history included. Get the container from _writable first or assign a new container. Only a board
+    that has never been copied owns all its containers.
+    """
 
     def __init__(self, player_names: List[str], simulation: bool = False):
         """Board constructor.
@@ -35,6 +48,8 @@ class Board:
         self.player_camel_cards: Dict[str, List[str]] = \
             {player_name: [camel for camel in CAMELS] for player_name in player_names}
         self._current_player_index = -1
+        self._shared = set()  # containers shared with other versions of the board
+        self.verbose = not simulation  # whether to print what happens on the board
 
         self.reset_etape(simulation)
 
@@ -66,28 +81,46 @@ class Board:
 
     def _remove_camel(self, camel: str):
         """Remove a camel from the field."""
-        field = self.camel_positions[camel][0]
-        self.camel_positions[camel] = (-1, -1)
+        camel_positions = self._writable('camel_positions')
+        field = camel_positions[camel][0]
+        camel_positions[camel] = (-1, -1)
         if field == 0:
             return
-        field_camels = [(camel, f, i) for camel, (f, i) in self.camel_positions.items() if f == field]
+        field_camels = [(camel, f, i) for camel, (f, i) in camel_positions.items() if f == field]
         field_camels = sorted(field_camels, key=lambda x: x[2])
         for new_i, (camel, f, i) in enumerate(field_camels):
-            self.camel_positions[camel] = (f, new_i)
+            camel_positions[camel] = (f, new_i)
 
     def _place_camel(self, camel: str, field: int, on_top: bool):
         """Place camel on top or bottom of field."""
-        camels_on_field = [(camel, f, i) for camel, (f, i) in self.camel_positions.items() if f == field]
+        camel_positions = self._writable('camel_positions')
+        camels_on_field = [(camel, f, i) for camel, (f, i) in camel_positions.items() if f == field]
         if len(camels_on_field) == 0:
-            self.camel_positions[camel] = (field, 0)
+            camel_positions[camel] = (field, 0)
         if on_top:
             maxim = max([x[2] for x in camels_on_field] + [-1])
-            self.camel_positions[camel] = (field, maxim + 1)
+            camel_positions[camel] = (field, maxim + 1)
         else:
             camels_on_field.append((camel, field, -1))
             camels_on_field = sorted(camels_on_field, key=lambda x: x[2])
             for new_i, (camel, f, i) in enumerate(camels_on_field):
-                self.camel_positions[camel] = (f, new_i)
+                camel_positions[camel] = (f, new_i)
+
+    def _writable(self, field: str):
+        """Get a container of the board for writing, copying it first if it is shared with another version.
+
+        Args:
+            field: name of the container (one of SHARED_FIELDS)
+
+        Returns:
+            the container owned by this board
+        """
+        value = getattr(self, field)
+        if field in self._shared:
+            value = copy(value)
+            setattr(self, field, value)
+            self._shared.discard(field)
+        return value
 
     @property
     def current_camel_order(self) -> Tuple[str]:
@@ -111,6 +144,38 @@ class Board:
         players = tuple(sorted(players, key=lambda x: x[1], reverse=True))
         return players
 
+    @property
+    def race_state(self) -> Tuple:
+        """State of the race - camel positions, stones and camels that have not rolled yet.
+
+        Boards with the same race state have the same etape and game outcome distributions.
+
+        Returns:
+            hashable race state
+        """
+        return (
+            tuple([self.camel_positions[camel] for camel in CAMELS]),
+            tuple(sorted([(field, stone.value) for field, stone in self.stones.items()])),
+            tuple([camel for camel in CAMELS if camel in self.camels_to_roll]),
+        )
+
+    @property
+    def position_key(self) -> Tuple:
+        """Key of the position from the current player's point of view.
+
+        Boards with the same position key have the same possible moves with the same expected values.
+
+        Returns:
+            hashable position key
+        """
+        return (
+            self.race_state,
+            tuple([tuple([bet.value for bet in self.available_etape_bets[camel]]) for camel in CAMELS]),
+            len(self.winning_bets),
+            len(self.losing_bets),
+            tuple([camel for camel in CAMELS if camel in self.player_camel_cards[self.current_player]]),
+        )
+
     @property
     def etape_ended(self) -> bool:
         """Whether the etape has ended."""
@@ -125,15 +190,20 @@ class Board:
         """End the etape."""
         order = self.current_camel_order
         self.camels_to_roll = [camel for camel in CAMELS]
+        self._shared.discard('camels_to_roll')
         if not simulation:
             self.available_etape_bets = {camel:
                                              [EtapeBet(camel, value) for value in ETAPE_BET_VALUES] for camel in CAMELS}
-            for player in self.player_banks.keys():
-                for etape_bet in self.player_etape_bets[player]:
+            self._shared.discard('available_etape_bets')
+            player_banks = self._writable('player_banks')
+            player_etape_bets = self._writable('player_etape_bets')
+            for player in player_banks.keys():
+                for etape_bet in player_etape_bets[player]:
                     to_cash_in = etape_bet.cash_in(order)
-                    print(f'Player {player} cashed in {to_cash_in} for {etape_bet}')
-                    self.player_banks[player] += to_cash_in
-                self.player_etape_bets[player] = []
+                    if self.verbose:
+                        print(f'Player {player} cashed in {to_cash_in} for {etape_bet}')
+                    player_banks[player] += to_cash_in
+                player_etape_bets[player] = []
 
         self.etape += 1
         self.etape_starter += 1
@@ -144,43 +214,36 @@ class Board:
     def cash_is_overalls(self):
         """Cash in the overall bets."""
         order = self.current_camel_order
+        player_banks = self._writable('player_banks')
         bet_queues = [self.losing_bets, self.winning_bets]
         for bet_queue in bet_queues:
             for bet in bet_queue:
                 bet_values = overall_bet_values()
                 if bet.camel == order[0]:
                     value = next(bet_values)
-                    print(f'Player {bet.player} won {value} for {bet}')
-                    self.player_banks[bet.player] += value
+                    if self.verbose:
+                        print(f'Player {bet.player} won {value} for {bet}')
+                    player_banks[bet.player] += value
                 else:
-                    print(f'Player {bet.player} lost {bet} (-1)')
-                    self.player_banks[bet.player] += -1
+                    if self.verbose:
+                        print(f'Player {bet.player} lost {bet} (-1)')
+                    player_banks[bet.player] += -1
 
     def copy(self, simulation: bool = False):
-        """Get a copy of the board.
+        """Get a copy of the board - a new version sharing all the containers with this board.
 
         Args:
-            simulation: whether the copy is used in a simulation
+            simulation: whether the copy is used in a simulation, simulation copies do not print anything
 
         Returns:
             copy of the board
         """
-        new_board = Board(list(self.player_banks.keys()), simulation)
-        new_board.etape = self.etape
-        new_board.etape_starter = self.etape_starter
-        new_board.camels_to_roll = copy(self.camels_to_roll)
-        new_board.stones = {i: copy(stone) for i, stone in self.stones.items()}
-        new_board.camel_positions = copy(self.camel_positions)
-        new_board._current_player_index = self._current_player_index
-        if not simulation:
-            new_board.available_etape_bets = copy(self.available_etape_bets)
-            new_board.winning_bets = copy(self.winning_bets)
-            new_board.losing_bets = copy(self.losing_bets)
-            new_board.player_banks = {player_name: copy(player_bank) for player_name, player_bank
-                                      in self.player_banks.items()}
-            new_board.player_camel_cards = copy(self.player_camel_cards)
-            new_board.player_etape_bets = {player_name: copy(player_bets) for player_name, player_bets
-                                           in self.player_etape_bets.items()}
+        new_board = Board.__new__(Board)
+        new_board.__dict__.update(self.__dict__)
+        if simulation:
+            new_board.verbose = False
+        self._shared = set(SHARED_FIELDS)
+        new_board._shared = set(SHARED_FIELDS)
         return new_board
 
     def vizualize(self):
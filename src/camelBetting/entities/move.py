@@ -67,7 +67,12 @@ class DiceRoll(Move):
     """Dice roll move."""
 
     def __init__(
-            self, board: Board, player: str, camel: Union[str, None] = None, dice: Union[int, None] = None
+            self,
+            board: Board,
+            player: str,
+            camel: Union[str, None] = None,
+            dice: Union[int, None] = None,
+            rng: Union[random.Random, None] = None,
     ) -> None:
         """Dice roll constructor.
 
@@ -76,15 +81,17 @@ class DiceRoll(Move):
             player: the player who is making the move
             camel: the camel to roll for
             dice: the number of dice to roll
+            rng: random generator for the random camel and dice, the global one if None
         """
         super().__init__(board, player)
+        rng = random if rng is None else rng
         self.is_random = camel is None or dice is None
         if camel is None:
-            self.camel = random.choice(self.board.camels_to_roll)
+            self.camel = rng.choice(self.board.camels_to_roll)
         else:
             self.camel = camel
         if dice is None:
-            self.dice = random.choice([1, 2, 3])
+            self.dice = rng.choice([1, 2, 3])
         else:
             if not 1 <= dice <= 3:
                 raise ValueError(f'Invalid number of dice: {dice}')
@@ -100,8 +107,9 @@ class DiceRoll(Move):
     def _realize_move(self) -> None:
         if not self.available:
             raise MoveNotAvailable()
-        self.board.camels_to_roll.pop(self.board.camels_to_roll.index(self.camel))
-        self.board.player_banks[self.player] += 1
+        self.board._writable('camels_to_roll').remove(self.camel)
+        player_banks = self.board._writable('player_banks')
+        player_banks[self.player] += 1
         field, index = self.board.camel_positions[self.camel]
         new_field = field + self.dice
         travelling_party = [(self.camel, field, index)]
@@ -118,8 +126,9 @@ class DiceRoll(Move):
             on_top = True
         else:
             stone = self.board.stones[new_field]
-            print(f'{stone.player}\'s stone was stepped on by {len(travelling_party)} camels.')
-            self.board.player_banks[stone.player] += len(travelling_party)
+            if self.board.verbose:
+                print(f'{stone.player}\'s stone was stepped on by {len(travelling_party)} camels.')
+            player_banks[stone.player] += len(travelling_party)
             new_field = new_field + stone.value
             if stone.value < 0:
                 on_top = False
@@ -171,14 +180,15 @@ class StonePut(Move):
     def _realize_move(self) -> None:
         if not self.available:
             raise MoveNotAvailable()
+        stones = self.board._writable('stones')
         index = None
-        for i, stone_pos in self.board.stones.items():
+        for i, stone_pos in stones.items():
             if stone_pos is not None and stone_pos.player == self.player:
                 index = i
                 break
         if index is not None:
-            self.board.stones.pop(index)
-        self.board.stones[self.field_position] = Stone(self.player, self.positive)
+            stones.pop(index)
+        stones[self.field_position] = Stone(self.player, self.positive)
 
     def __repr__(self):
         return f'{self.player} put stone on field {self.field_position} with value {"+1" if self.positive else "-1"}'
@@ -217,8 +227,11 @@ class BetEtapeWinner(Move):
     def _realize_move(self) -> None:
         if not self.available:
             raise MoveNotAvailable()
-        bet = self.board.available_etape_bets[self.camel].pop(0)
-        self.board.player_etape_bets[self.player].append(bet)
+        available_etape_bets = self.board._writable('available_etape_bets')
+        bet = available_etape_bets[self.camel][0]
+        available_etape_bets[self.camel] = available_etape_bets[self.camel][1:]
+        player_etape_bets = self.board._writable('player_etape_bets')
+        player_etape_bets[self.player] = player_etape_bets[self.player] + [bet]
 
     @property
     def shortcut(self) -> str:
@@ -241,30 +254,40 @@ class BetOverall(Move):
 
     def _min_expected_value(self, outcomes: Dict[Tuple[str], int]) -> float:
         """Minimal expected value for the move based on how many blind bets were placed on winner/loser."""
+        place = 0 if self.winner else -1
+        overall = sum(outcomes.values())
+        placed = sum([value for outcome, value in outcomes.items() if outcome[place] == self.camel])
+        return self.expected_value_from_probability(placed / overall)
+
+    def expected_value_from_probability(self, probability: float) -> float:
+        """Minimal expected value of the move given the probability that the bet is right.
+
+        Args:
+            probability: probability of the camel winning (losing) the game
+
+        Returns:
+            minimal expected value
+        """
         if self.winner:
             bets_placed = len(self.board.winning_bets)
-            place = 0
         else:
             bets_placed = len(self.board.losing_bets)
-            place = -1
         if bets_placed >= len(OVERALL_BET_VALUES):
             minimal_value = 1
         else:
             minimal_value = OVERALL_BET_VALUES[bets_placed]
-
-        overall = sum(outcomes.values())
-        placed = sum([value for outcome, value in outcomes.items() if outcome[place] == self.camel])
-        return (placed * minimal_value - (overall - placed) * 1) / overall
+        return probability * minimal_value - (1 - probability) * 1
 
     def _realize_move(self) -> None:
         if not self.available:
             raise MoveNotAvailable()
-        self.board.player_camel_cards[self.player].pop(self.board.player_camel_cards[self.player].index(self.camel))
+        player_camel_cards = self.board._writable('player_camel_cards')
+        player_camel_cards[self.player] = [camel for camel in player_camel_cards[self.player] if camel != self.camel]
         bet = OverallBet(self.camel, self.player)
         if self.winner:
-            self.board.winning_bets.append(bet)
+            self.board._writable('winning_bets').append(bet)
         else:
-            self.board.losing_bets.append(bet)
+            self.board._writable('losing_bets').append(bet)
 
     def __repr__(self):
         if self.winner:
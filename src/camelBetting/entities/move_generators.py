@@ -1,6 +1,7 @@
 from camelBetting.entities.board import Board, CAMELS
 from camelBetting.entities.move import Move, DiceRoll, StonePut, BetEtapeWinner, BetOverall
 
+import random
 from typing import List, Union
 
 
@@ -22,18 +23,21 @@ def simulation_moves(board: Board) -> List[Move]:
     return moves
 
 
-def possible_game_moves(board: Board, player: str, random_rolls: bool = True) -> List[Move]:
+def possible_game_moves(
+        board: Board, player: str, random_rolls: bool = True, rng: Union[random.Random, None] = None
+) -> List[Move]:
     """Get all moves.
 
     Args:
         board: current board
         player: current player name
         random_rolls: whether to use only random rolls
+        rng: random generator of the random roll, the global one if None
 
     Returns:
         list of moves
     """
-    moves = [DiceRoll(board, player)]
+    moves = [DiceRoll(board, player, rng=rng)]
     if not random_rolls:
         for camel in board.camels_to_roll:
             for i in [1, 2, 3]:
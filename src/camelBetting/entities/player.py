@@ -3,9 +3,29 @@ import random
 
 from camelBetting.entities.move import Move, StonePut, BetOverall, DiceRoll
 from camelBetting.simulation import Simulation
+from camelBetting.outcome_store import OutcomeStore
+from camelBetting.subtree_cache import SubtreeCache
+from camelBetting.scheduler import MoveScheduler
+from camelBetting.rollout_policies import RolloutPolicy
+from camelBetting.expectimax import ExpectimaxSearch
+from camelBetting.surrogate import default_surrogate
 from camelBetting.entities.board import Board
 
-from typing import List, Tuple, Union
+from typing import List, Tuple, Union, Dict
+
+
+class EvaluationRequest:
+    """Evaluation a player needs to choose a move, answered by a batched evaluation of many games."""
+
+    def __init__(self, board: Board, game_approx_number: int = 0):
+        """Evaluation request constructor.
+
+        Args:
+            board: board to evaluate, its etape outcomes are always evaluated
+            game_approx_number: number of rollouts approximating the game outcomes, 0 if they are not needed
+        """
+        self.board = board
+        self.game_approx_number = game_approx_number
 
 
 class Player:
@@ -27,6 +47,38 @@ class Player:
         """
         raise NotImplementedError()
 
+    def request_evaluation(self, moves: List[Move], board: Board) -> Union[Move, EvaluationRequest]:
+        """First half of a batched decision - choose a move or ask for the evaluation needed to choose it.
+
+        Args:
+            moves: possible moves
+            board: current board
+
+        Returns:
+            chosen move or the evaluation request, which is answered by choose_evaluated_move
+        """
+        return self.choose_move(moves, board)
+
+    def choose_evaluated_move(
+            self,
+            moves: List[Move],
+            board: Board,
+            etape_outcomes: Dict[Tuple[str], int],
+            game_outcomes: Union[Dict[Tuple[str], int], None],
+    ) -> Move:
+        """Second half of a batched decision - choose a move given the requested evaluation.
+
+        Args:
+            moves: possible moves
+            board: current board
+            etape_outcomes: camel order at the end of the etape -> number of occurrences
+            game_outcomes: camel order at the end of the game -> number of rollouts, None if not requested
+
+        Returns:
+            chosen move
+        """
+        raise NotImplementedError()
+
 
 class HumanPlayer(Player):
 
@@ -70,6 +122,16 @@ class HumanPlayer(Player):
 class BasicNpc(Player):
     """A player that chooses the highest EV value and places stones."""
 
+    def __init__(self, name: str, rng: Union[random.Random, None] = None):
+        """Basic NPC constructor.
+
+        Args:
+            name: name of the player
+            rng: random generator of the random choices, the global one if None
+        """
+        super().__init__(name)
+        self.rng = random if rng is None else rng
+
     def _place_stone(self, moves: List[Move], board: Board, camel_pos: List[int]) -> Union[Move, None]:
         """Method for deciding whether to place a stone and where.
 
@@ -87,7 +149,7 @@ class BasicNpc(Player):
             ideal_stone_moves = [move for move in stone_moves if
                                  max(camel_pos) < move.field_position < max(camel_pos) + 3]
             if len(ideal_stone_moves) > 0:
-                return random.choice(ideal_stone_moves)
+                return self.rng.choice(ideal_stone_moves)
             inteligent_stone_moves = list(sorted(
                 [move for move in stone_moves if max(camel_pos) < move.field_position],
                 key=lambda x: x.field_position
@@ -104,11 +166,36 @@ class EvilNpc(BasicNpc):
             name: str,
             threshold_for_overall_bets: int,
             game_approx_number: int,
+            surrogate_error_bound: Union[float, None] = None,
+            outcome_store: Union[OutcomeStore, None] = None,
+            subtree_cache: Union[SubtreeCache, None] = None,
+            move_budget: Union[float, None] = None,
+            rollout_policy: Union[RolloutPolicy, None] = None,
     ):
-        """Evil NPC constructor."""
+        """Evil NPC constructor.
+
+        Args:
+            name: name of the player
+            threshold_for_overall_bets: threshold for placing overall bets
+            game_approx_number: number of simulations for game approximation
+            surrogate_error_bound: the surrogate model is used instead of the game approximation when its expected
+                error is at most this bound, None to never use it
+            outcome_store: persistent store of etape outcomes shared by the simulations
+            subtree_cache: cache of etape subtrees kept across the decisions, a new one if None
+            move_budget: wall-clock time budget of a move in seconds, the evaluation engines are chosen to fit
+                in it (see scheduler.MoveScheduler), None to always run the full evaluation
+            rollout_policy: policy of the players' moves other than the dice rolls in the game approximation
+                rollouts, the players only roll the dice if None
+        """
         super().__init__(name)
         self.threshold_for_overall_bets = threshold_for_overall_bets
         self.game_approx_number = game_approx_number
+        self.surrogate_error_bound = surrogate_error_bound
+        self.outcome_store = outcome_store
+        self.subtree_cache = SubtreeCache() if subtree_cache is None else subtree_cache
+        self.scheduler = MoveScheduler(move_budget) if move_budget is not None else None
+        self.rollout_policy = rollout_policy
+        self.last_engines: Dict[str, str] = {}
 
     def choose_move(self, moves: List[Move], board: Board) -> Move:
         """Chooses to place a stone or best EV move in current situation.
@@ -124,21 +211,103 @@ class EvilNpc(BasicNpc):
         stone_move = self._place_stone(moves, board, camel_pos)
         if stone_move is not None:
             return stone_move
+        return self._pick_move(self._move_evs(moves, board, camel_pos))
 
-        sim = Simulation(board)
-        etape_outcomes = sim.simulate_etape()
+    def request_evaluation(self, moves: List[Move], board: Board) -> Union[Move, EvaluationRequest]:
+        if self.scheduler is not None:
+            # a budgeted move evaluates on its own to keep to the budget
+            return self.choose_move(moves, board)
+        camel_pos = [x[0] for x in board.camel_positions.values()]
+        stone_move = self._place_stone(moves, board, camel_pos)
+        if stone_move is not None:
+            return stone_move
+        game_approx_number = 0
+        if max(camel_pos) >= self.threshold_for_overall_bets and not self._use_surrogate(board):
+            game_approx_number = self.game_approx_number
+        if game_approx_number > 0 and self.rollout_policy is not None:
+            # the batched game rollouts only roll the dice
+            return self._pick_move(self._move_evs(moves, board, camel_pos))
+        return EvaluationRequest(board, game_approx_number)
+
+    def choose_evaluated_move(
+            self,
+            moves: List[Move],
+            board: Board,
+            etape_outcomes: Dict[Tuple[str], int],
+            game_outcomes: Union[Dict[Tuple[str], int], None],
+    ) -> Move:
+        camel_pos = [x[0] for x in board.camel_positions.values()]
+        return self._pick_move(self._move_evs(moves, board, camel_pos, etape_outcomes, game_outcomes))
+
+    def _pick_move(self, move_evs: List[Tuple[Move, float]]) -> Move:
+        """Pick a move from the moves sorted from the highest expected value."""
+        return move_evs[0][0]
+
+    def _use_surrogate(self, board: Board) -> bool:
+        """Whether the surrogate model is accurate enough for the overall bets on the board."""
+        if self.surrogate_error_bound is None:
+            return False
+        surrogate = default_surrogate()
+        return surrogate is not None and surrogate.error(board) <= self.surrogate_error_bound
+
+    def _move_evs(
+            self,
+            moves: List[Move],
+            board: Board,
+            camel_pos: List[int],
+            etape_outcomes: Union[Dict[Tuple[str], int], None] = None,
+            game_outcomes: Union[Dict[Tuple[str], int], None] = None,
+    ) -> List[Tuple[Move, float]]:
+        """Expected values of the moves.
+
+        Args:
+            moves: possible moves
+            board: current board
+            camel_pos: positions of the camels
+            etape_outcomes: etape outcomes evaluated in advance, simulated if None
+            game_outcomes: game outcomes evaluated in advance, approximated if None and needed
+
+        Returns:
+            list of (move, expected value) sorted from the highest expected value
+        """
+        sim = Simulation(board, self.outcome_store, subtree_cache=self.subtree_cache,
+                         rollout_policy=self.rollout_policy)
+        overall_bets = max(camel_pos) >= self.threshold_for_overall_bets
+        if etape_outcomes is None and self.scheduler is not None:
+            self.scheduler.start_move()
+            etape_outcomes = self.scheduler.etape_outcomes(sim, overall_bets)
+        elif etape_outcomes is None:
+            etape_outcomes = sim.simulate_etape()
         move_evs = [(move, move.expected_value(etape_outcomes)) for move in moves
                     if not isinstance(move, BetOverall)]
-        if max(camel_pos) >= self.threshold_for_overall_bets:
-            game_approx = sim.approximate_game(self.game_approx_number)
-            overall_evs = [(move, move.expected_value(game_approx)) for move in moves if isinstance(move, BetOverall)]
+        if overall_bets and self.scheduler is not None:
+            probabilities = self.scheduler.game_probabilities(
+                sim, self.game_approx_number, default_surrogate(), self.surrogate_error_bound
+            )
+            if probabilities is not None:
+                win_probs, lose_probs = probabilities
+                move_evs += [(move, move.expected_value_from_probability(
+                    win_probs[move.camel] if move.winner else lose_probs[move.camel]
+                )) for move in moves if isinstance(move, BetOverall)]
+        elif overall_bets:
+            if self._use_surrogate(board):
+                win_probs, lose_probs = default_surrogate().predict(board)
+                overall_evs = [(move, move.expected_value_from_probability(
+                    win_probs[move.camel] if move.winner else lose_probs[move.camel]
+                )) for move in moves if isinstance(move, BetOverall)]
+            else:
+                game_approx = sim.approximate_game(self.game_approx_number) if game_outcomes is None \
+                    else game_outcomes
+                overall_evs = [(move, move.expected_value(game_approx)) for move in moves
+                               if isinstance(move, BetOverall)]
             move_evs += overall_evs
+        if self.scheduler is not None:
+            self.last_engines = dict(self.scheduler.last_engines)
 
-        move_evs = list(sorted(move_evs, key=lambda x: x[1], reverse=True))
-        return move_evs[0][0]
+        return list(sorted(move_evs, key=lambda x: x[1], reverse=True))
 
 
-class AdequateNpc(BasicNpc):
+class AdequateNpc(EvilNpc):
     """NPC that chooses one of the few highest EV value and places stones."""
 
     def __init__(
@@ -147,22 +316,69 @@ class AdequateNpc(BasicNpc):
             threshold_for_overall_bets: int,
             game_approx_number: int,
             n_top_moves: int,
+            surrogate_error_bound: Union[float, None] = None,
+            outcome_store: Union[OutcomeStore, None] = None,
+            subtree_cache: Union[SubtreeCache, None] = None,
+            move_budget: Union[float, None] = None,
+            rollout_policy: Union[RolloutPolicy, None] = None,
     ):
-        """Evil NPC constructor.
+        """Adequate NPC constructor.
 
         Args:
             name: name of the player
             threshold_for_overall_bets: threshold for placing overall bets
             game_approx_number: number of simulations for game approximation
             n_top_moves: number of top moves to choose from randomly
+            surrogate_error_bound: the surrogate model is used instead of the game approximation when its expected
+                error is at most this bound, None to never use it
+            outcome_store: persistent store of etape outcomes shared by the simulations
+            subtree_cache: cache of etape subtrees kept across the decisions, a new one if None
+            move_budget: wall-clock time budget of a move in seconds, the evaluation engines are chosen to fit
+                in it (see scheduler.MoveScheduler), None to always run the full evaluation
+            rollout_policy: policy of the players' moves other than the dice rolls in the game approximation
+                rollouts, the players only roll the dice if None
+        """
+        super().__init__(
+            name, threshold_for_overall_bets, game_approx_number, surrogate_error_bound, outcome_store, subtree_cache,
+            move_budget, rollout_policy,
+        )
+        self.n_top_moves = n_top_moves
+
+    def _pick_move(self, move_evs: List[Tuple[Move, float]]) -> Move:
+        """Pick one of the top moves randomly from the moves sorted from the highest expected value."""
+        return self.rng.choice(move_evs[:self.n_top_moves])[0]
+
+
+class ExpectimaxNpc(BasicNpc):
+    """NPC that looks a few moves ahead with an expectimax search over own moves, opponent moves and dice."""
+
+    def __init__(
+            self,
+            name: str,
+            threshold_for_overall_bets: int,
+            game_approx_number: int,
+            max_depth: int = 3,
+            time_limit: Union[float, None] = 2.0,
+    ):
+        """Expectimax NPC constructor.
+
+        Args:
+            name: name of the player
+            threshold_for_overall_bets: threshold for placing overall bets
+            game_approx_number: number of simulations for game approximation
+            max_depth: maximal search depth in plies
+            time_limit: time limit for the iterative deepening in seconds
         """
         super().__init__(name)
         self.threshold_for_overall_bets = threshold_for_overall_bets
         self.game_approx_number = game_approx_number
-        self.n_top_moves = n_top_moves
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.last_search_stats: Dict[str, int] = {}
+        self.subtree_cache = SubtreeCache()
 
     def choose_move(self, moves: List[Move], board: Board) -> Move:
-        """Chooses to place a stone or best EV move in current situation.
+        """Chooses the best move found by the search, the etape EVs are used for move ordering.
 
         Args:
             moves: possible moves
@@ -172,29 +388,44 @@ class AdequateNpc(BasicNpc):
             chosen move
         """
         camel_pos = [x[0] for x in board.camel_positions.values()]
-        stone_move = self._place_stone(moves, board, camel_pos)
-        if stone_move is not None:
-            return stone_move
-
-        sim = Simulation(board)
+        sim = Simulation(board, subtree_cache=self.subtree_cache)
         etape_outcomes = sim.simulate_etape()
         move_evs = [(move, move.expected_value(etape_outcomes)) for move in moves
                     if not isinstance(move, BetOverall)]
+        move_evs = list(sorted(move_evs, key=lambda x: x[1], reverse=True))
+
+        search = ExpectimaxSearch(
+            self.name,
+            max_depth=self.max_depth,
+            time_limit=self.time_limit,
+            move_scores={move.shortcut: ev for move, ev in move_evs},
+        )
+        best_shortcut, best_value = search.search(board)
+        self.last_search_stats = search.stats
+        move_shortcuts = [move.shortcut for move in moves]
+        if best_shortcut is None or best_shortcut not in move_shortcuts:
+            best_move, best_ev = move_evs[0]
+        else:
+            best_move = moves[move_shortcuts.index(best_shortcut)]
+            best_ev = dict([(move.shortcut, ev) for move, ev in move_evs])[best_shortcut]
+
         if max(camel_pos) >= self.threshold_for_overall_bets:
+            # the search value is a money lead after the replies, the overall bets are compared with the
+            # expected value of the searched move instead
             game_approx = sim.approximate_game(self.game_approx_number)
             overall_evs = [(move, move.expected_value(game_approx)) for move in moves if isinstance(move, BetOverall)]
-            move_evs += overall_evs
-
-        move_evs = list(sorted(move_evs, key=lambda x: x[1], reverse=True))
-        return random.choice(move_evs[:self.n_top_moves])[0]
+            overall_evs = list(sorted(overall_evs, key=lambda x: x[1], reverse=True))
+            if len(overall_evs) > 0 and overall_evs[0][1] > best_ev:
+                return overall_evs[0][0]
+        return best_move
 
 
 class RandomNpc(BasicNpc):
     """NPC that chooses a random move apart from stone placing."""
 
-    def __init__(self, name: str, threshold_for_overall_bets: int):
+    def __init__(self, name: str, threshold_for_overall_bets: int, rng: Union[random.Random, None] = None):
         """Random NPC constructor."""
-        super().__init__(name)
+        super().__init__(name, rng)
         self.threshold_for_overall_bets = threshold_for_overall_bets
 
     def choose_move(self, moves: List[Move], board: Board) -> Move:
@@ -212,8 +443,8 @@ class RandomNpc(BasicNpc):
         if stone_move is not None:
             return stone_move
         if max(camel_pos) > self.threshold_for_overall_bets:
-            return random.choice([move for move in moves if not isinstance(move, StonePut)])
-        return random.choice(
+            return self.rng.choice([move for move in moves if not isinstance(move, StonePut)])
+        return self.rng.choice(
             [move for move in moves if not isinstance(move, StonePut) and not isinstance(move, BetOverall)]
         )
 
@@ -235,14 +466,14 @@ class LessRandomNpc(RandomNpc):
         if stone_move is not None:
             return stone_move
         preselected_moves = [move for move in moves if isinstance(move, DiceRoll)]  # take dice roll as a baseline
-        preselected_moves.append(random.choice(
+        preselected_moves.append(self.rng.choice(
             [move for move in moves if not isinstance(move, StonePut) and not isinstance(move, BetOverall)]
         ))  # append a normal move
         if max(camel_pos) > self.threshold_for_overall_bets:  # append an overall bet
             overall_moves = [move for move in moves if isinstance(move, BetOverall)]
             if len(overall_moves) > 0:
-                preselected_moves.append(random.choice(overall_moves))
-        return random.choice(preselected_moves)
+                preselected_moves.append(self.rng.choice(overall_moves))
+        return self.rng.choice(preselected_moves)
 
 
 class RollerNpc(BasicNpc):
@@ -250,4 +481,4 @@ class RollerNpc(BasicNpc):
     def choose_move(self, moves: List[Move], board: Board) -> Move:
         rolling_moves = [move for move in moves if isinstance(move, DiceRoll)]
         if len(rolling_moves) > 0:
-            return random.choice(rolling_moves)
+            return self.rng.choice(rolling_moves)
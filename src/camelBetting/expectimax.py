@@ -0,0 +1,233 @@
+"""Module containing the depth-limited expectimax search with Star1/Star2 chance node pruning."""
+from camelBetting.entities.board import Board, CAMELS
+from camelBetting.entities.move import Move, DiceRoll, StonePut, BetEtapeWinner
+
+import time
+from typing import Dict, List, Tuple, Union
+
+ROLL = 'r'  # shortcut of the random dice roll, which is searched as a chance node
+
+
+class SearchTimeout(Exception):
+    """Exception to raise when the search runs out of time."""
+    pass
+
+
+class ExpectimaxSearch:
+    """Depth-limited expectimax (*-minimax) search over own moves, opponent moves and dice rolls.
+
+    Own moves are max nodes, opponent moves are min nodes (the opponents are assumed to play against us) and
+    the random dice roll is a chance node over all the (camel, dice) outcomes. Chance nodes are pruned with
+    Star1 and probed with Star2, which requires the evaluation to be bounded - it is clipped to
+    [-value_bound, value_bound].
+    """
+
+    def __init__(
+            self,
+            player: str,
+            max_depth: int = 3,
+            time_limit: Union[float, None] = None,
+            value_bound: float = 20,
+            move_scores: Union[Dict[str, float], None] = None,
+    ):
+        """Expectimax search constructor.
+
+        Args:
+            player: player to search for
+            max_depth: maximal number of plies (moves of any player) to look ahead
+            time_limit: time limit in seconds for the iterative deepening, None for no limit
+            value_bound: bound of the evaluation, the evaluation is clipped to [-value_bound, value_bound]
+            move_scores: move shortcut -> score used for move ordering (e.g. the etape EVs of the moves)
+        """
+        self.player = player
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.lower = -value_bound
+        self.upper = value_bound
+        self.move_scores = move_scores if move_scores is not None else {}
+        self.stats: Dict[str, int] = {}
+        self._deadline = None
+        self._root_value = 0
+        self._best_first = None
+
+    def search(self, board: Board) -> Tuple[Union[str, None], float]:
+        """Search for the best move with iterative deepening.
+
+        Args:
+            board: current board, the current player has to be the searching player
+
+        Returns:
+            shortcut of the best move (None if not even depth 1 was finished in time) and its value
+        """
+        self.stats = {
+            'nodes': 0,
+            'depth': 0,
+            'alpha_beta_prunes': 0,
+            'star1_prunes': 0,
+            'star2_prunes': 0,
+        }
+        self._deadline = None if self.time_limit is None else time.perf_counter() + self.time_limit
+        self._best_first = None
+        root = board.copy()
+        root.verbose = False
+        self._root_value = 0
+        self._root_value = self._raw_value(root)
+        best_move, best_value = None, 0
+        try:
+            for depth in range(1, self.max_depth + 1):
+                best_move, best_value = self._root(root, depth)
+                self._best_first = best_move
+                self.stats['depth'] = depth
+        except SearchTimeout:
+            pass
+        return best_move, best_value
+
+    def _root(self, board: Board, depth: int) -> Tuple[str, float]:
+        """Search the root node with a full window."""
+        alpha, beta = self.lower, self.upper
+        best_move, best_value = None, self.lower - 1
+        for action in self._ordered_actions(board):
+            value = self._action_value(board, action, depth, alpha, beta)
+            if value > best_value:
+                best_move, best_value = self._shortcut(action), value
+                alpha = max(alpha, value)
+        return best_move, best_value
+
+    def _search(self, board: Board, depth: int, alpha: float, beta: float) -> float:
+        """Fail-soft alpha-beta search of a decision node."""
+        self.stats['nodes'] += 1
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise SearchTimeout()
+        if depth == 0 or board.game_ended:
+            return self._evaluate(board)
+        maximize = board.current_player == self.player
+        best = self.lower - 1 if maximize else self.upper + 1
+        for action in self._ordered_actions(board):
+            value = self._action_value(board, action, depth, alpha, beta)
+            if maximize:
+                best = max(best, value)
+                alpha = max(alpha, best)
+            else:
+                best = min(best, value)
+                beta = min(beta, best)
+            if alpha >= beta:
+                self.stats['alpha_beta_prunes'] += 1
+                break
+        return best
+
+    def _action_value(
+            self, board: Board, action: Union[Move, None], depth: int, alpha: float, beta: float
+    ) -> float:
+        """Value of playing an action (None is the random dice roll) on the board."""
+        if action is None:
+            return self._chance(board, depth, alpha, beta)
+        child = action.play()
+        self._after_move(child)
+        return self._search(child, depth - 1, alpha, beta)
+
+    def _chance(self, board: Board, depth: int, alpha: float, beta: float) -> float:
+        """Star1 chance node over all the equally likely dice roll outcomes, with Star2 probing."""
+        self.stats['nodes'] += 1
+        player = board.current_player
+        children = []
+        for camel in board.camels_to_roll:
+            for dice in [1, 2, 3]:
+                child = DiceRoll(board, player, camel, dice).play()
+                self._after_move(child)
+                children.append(child)
+        n = len(children)
+        lower = [self.lower] * n
+        upper = [self.upper] * n
+        for i, child in enumerate(children):
+            if depth == 1 or child.game_ended:
+                lower[i] = upper[i] = self._evaluate(child)
+
+        # Star2: probe the first move of each child to get a bound of it
+        if depth > 1:
+            for i, child in enumerate(children):
+                if lower[i] == upper[i]:
+                    continue
+                actions = self._ordered_actions(child)
+                if child.current_player == self.player:
+                    beta_i = n * beta - (sum(lower) - lower[i])
+                    value = self._action_value(child, actions[0], depth - 1, lower[i], min(beta_i, upper[i]))
+                    lower[i] = min(max(lower[i], value), upper[i])
+                    if sum(lower) >= n * beta:
+                        self.stats['star2_prunes'] += 1
+                        return sum(lower) / n
+                else:
+                    alpha_i = n * alpha - (sum(upper) - upper[i])
+                    value = self._action_value(child, actions[0], depth - 1, max(alpha_i, lower[i]), upper[i])
+                    upper[i] = max(min(upper[i], value), lower[i])
+                    if sum(upper) <= n * alpha:
+                        self.stats['star2_prunes'] += 1
+                        return sum(upper) / n
+
+        # Star1: search the children with the window that can still change the result
+        done = 0
+        for i, child in enumerate(children):
+            rest_lower = sum(lower[i + 1:])
+            rest_upper = sum(upper[i + 1:])
+            alpha_i = n * alpha - done - rest_upper
+            beta_i = n * beta - done - rest_lower
+            if lower[i] == upper[i]:
+                value = lower[i]
+            else:
+                value = self._search(child, depth - 1, max(alpha_i, lower[i]), min(beta_i, upper[i]))
+                value = min(max(value, lower[i]), upper[i])
+            if value <= alpha_i:
+                self.stats['star1_prunes'] += 1
+                return (done + value + rest_upper) / n
+            if value >= beta_i:
+                self.stats['star1_prunes'] += 1
+                return (done + value + rest_lower) / n
+            done += value
+        return done / n
+
+    def _ordered_actions(self, board: Board) -> List[Union[Move, None]]:
+        """Candidate actions of the current player ordered from the most promising one.
+
+        Overall bets are not searched - their value is only known at the end of the game. Stones are only
+        considered right in front of the leading camel, where they can influence the etape.
+        """
+        player = board.current_player
+        actions: List[Union[Move, None]] = [None]
+        for camel in CAMELS:
+            move = BetEtapeWinner(board, player, camel)
+            if move.available:
+                actions.append(move)
+        leader_field = max([f for f, i in board.camel_positions.values()])
+        for field_position in range(leader_field + 1, leader_field + 4):
+            for positive in [True, False]:
+                move = StonePut(board, player, field_position, positive)
+                if move.available:
+                    actions.append(move)
+        actions.sort(key=lambda x: self.move_scores.get(self._shortcut(x), 0), reverse=True)
+        if self._best_first is not None and player == self.player:
+            actions.sort(key=lambda x: self._shortcut(x) != self._best_first)
+        return actions
+
+    @staticmethod
+    def _shortcut(action: Union[Move, None]) -> str:
+        """Shortcut of the action."""
+        return ROLL if action is None else action.shortcut
+
+    @staticmethod
+    def _after_move(board: Board) -> None:
+        """Finish the etape if the move ended it, so that the etape bets get cashed in."""
+        if board.etape_ended:
+            board.reset_etape()
+
+    def _raw_value(self, board: Board) -> float:
+        """Difference between the player's and the best opponent's money relative to the root."""
+        order = board.current_camel_order
+        money = {}
+        for player, bank in board.player_banks.items():
+            money[player] = bank + sum([bet.cash_in(order) for bet in board.player_etape_bets[player]])
+        opponents = [value for player, value in money.items() if player != self.player]
+        best_opponent = max(opponents) if len(opponents) > 0 else 0
+        return money[self.player] - best_opponent - self._root_value
+
+    def _evaluate(self, board: Board) -> float:
+        """Bounded evaluation of the board."""
+        return min(max(self._raw_value(board), self.lower), self.upper)
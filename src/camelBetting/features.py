@@ -0,0 +1,51 @@
+"""Module containing the numeric features of the race and labels of its outcomes."""
+from camelBetting.entities.board import Board, CAMELS
+
+from typing import Dict, Tuple
+
+import numpy as np
+
+N_FIELDS = 17  # fields 0 - 16
+FEATURE_SIZE = 3 * len(CAMELS) + N_FIELDS
+LABEL_SIZE = len(CAMELS) * len(CAMELS)
+
+
+def board_features(board: Board) -> np.ndarray:
+    """Features of the race on the board.
+
+    For every camel its field, its height in the stack and whether it has not rolled yet, followed by the
+    stone values on the fields.
+
+    Args:
+        board: board to get the features of
+
+    Returns:
+        feature vector of length FEATURE_SIZE
+    """
+    features = np.zeros(FEATURE_SIZE, dtype=np.float32)
+    for i, camel in enumerate(CAMELS):
+        field, height = board.camel_positions[camel]
+        features[3 * i] = field
+        features[3 * i + 1] = height
+        features[3 * i + 2] = camel in board.camels_to_roll
+    for field, stone in board.stones.items():
+        if 0 <= field < N_FIELDS:
+            features[3 * len(CAMELS) + field] = stone.value
+    return features
+
+
+def rank_probabilities(outcomes: Dict[Tuple[str], int]) -> np.ndarray:
+    """Probabilities of the camels finishing on the ranks.
+
+    Args:
+        outcomes: camel order -> number of occurrences
+
+    Returns:
+        label vector of length LABEL_SIZE, the probability of camel i on rank r is at i * len(CAMELS) + r
+    """
+    labels = np.zeros(LABEL_SIZE, dtype=np.float32)
+    overall = sum(outcomes.values())
+    for order, n in outcomes.items():
+        for rank, camel in enumerate(order):
+            labels[CAMELS.index(camel) * len(CAMELS) + rank] += n / overall
+    return labels
@@ -2,8 +2,10 @@
 from camelBetting.entities.board import Board
 from camelBetting.entities.player import Player, EvilNpc, RandomNpc, HumanPlayer
 from camelBetting.entities.move_generators import possible_game_moves
+from camelBetting.entities.move import Move
 
-from typing import Tuple, List, Dict, Generator
+import random
+from typing import Tuple, List, Dict, Generator, Union
 
 
 OVERALL_BET_VALUES = [8, 5, 3, 2]
@@ -12,23 +14,74 @@ OVERALL_BET_VALUES = [8, 5, 3, 2]
 class Game:
     """The Game class."""
 
-    def __init__(self, players: List[Player]):
+    def __init__(self, players: List[Player], rng: Union[random.Random, None] = None):
+        """Game constructor.
+
+        Args:
+            players: players in the order of their turns
+            rng: random generator of the random dice rolls, the global one if None
+        """
         self.board: Board = Board([player.name for player in players])
+        self.rng = rng
         self.players: Dict[str, Player] = {player.name: player for player in players}
+        self.history: List[Board] = [self.board]  # board versions, the current board is the last one
+        self.moves: List[Move] = []  # moves leading from each board version to the next one
 
     def play(self):
         """Play the game."""
         while not self.board.game_ended:
+            self.step()
+
+    def step(self, move: Union[Move, None] = None) -> Move:
+        """Let the current player choose and play a move.
+
+        Args:
+            move: move of the current player chosen outside of the game (e.g. by a batched evaluation of many
+                games), the current player chooses if None
+
+        Returns:
+            the played move
+        """
+        if move is None:
             player = self.players[self.board.current_player]
-            possible_moves = possible_game_moves(self.board, player.name)
+            possible_moves = possible_game_moves(self.board, player.name, rng=self.rng)
             if isinstance(player, HumanPlayer):
                 self.board.vizualize()
             move = player.choose_move(possible_moves, self.board)
-            print(move)
-            self.board = move.play()
-            if self.board.etape_ended:
-                print("ETAPE ENDED")
-                print(self.board.current_camel_order)
-                self.board.reset_etape()
-                print(self.board.current_player_order)
-                print(f"NEXT ETAPE: {self.board.etape}")
+        print(move)
+        self.board = move.play()
+        if self.board.etape_ended:
+            print("ETAPE ENDED")
+            print(self.board.current_camel_order)
+            self.board.reset_etape()
+            print(self.board.current_player_order)
+            print(f"NEXT ETAPE: {self.board.etape}")
+        self.history.append(self.board)
+        self.moves.append(move)
+        return move
+
+    def undo(self, n_moves: int = 1) -> Board:
+        """Take back the last moves.
+
+        Args:
+            n_moves: number of moves to take back
+
+        Returns:
+            the current board after taking the moves back
+        """
+        if not 0 <= n_moves < len(self.history):
+            raise ValueError(f'Cannot undo {n_moves} moves, only {len(self.moves)} were played.')
+        if n_moves > 0:
+            del self.history[-n_moves:]
+            del self.moves[-n_moves:]
+        self.board = self.history[-1]
+        return self.board
+
+    def replay(self) -> Generator[Tuple[Board, Move, Board], None, None]:
+        """Replay the game.
+
+        Yields:
+            board before the move, the move and the board after it
+        """
+        for i, move in enumerate(self.moves):
+            yield self.history[i], move, self.history[i + 1]
@@ -0,0 +1,149 @@
+"""Module containing the driver advancing many games in lockstep with batched evaluations of the NPC decisions."""
+from camelBetting.entities.board import Board
+from camelBetting.entities.move_generators import possible_game_moves
+from camelBetting.entities.player import EvaluationRequest
+from camelBetting.game import Game
+from camelBetting.outcome_store import OutcomeStore
+from camelBetting.simulation import Simulation
+from camelBetting.subtree_cache import SubtreeCache
+from camelBetting.symmetry import canonical_race_state, relabel_outcomes, inverse_labels
+from camelBetting.vectorized import approximate_games
+
+from concurrent.futures import Executor
+import random
+from typing import Dict, List, Tuple, Union
+
+
+def simulate_etape(board: Board) -> Dict[Tuple[str], int]:
+    """Simulate the etape of a board in a worker of the lockstep driver."""
+    return dict(Simulation(board).simulate_etape())
+
+
+class LockstepDriver:
+    """Driver playing many games at once, one move of every running game per step.
+
+    The NPCs of all the games first ask for the evaluations they need (see Player.request_evaluation), the
+    requests are deduplicated by the canonical race state (see symmetry.canonical_race_state) and evaluated in
+    one batch, and the NPCs then choose their moves from the results. The etape evaluations share one subtree
+    cache and the game rollouts of the whole batch run as one vectorized call (see vectorized.approximate_games),
+    so the cost of a decision falls with the number of games played together.
+    """
+
+    def __init__(
+            self,
+            games: List[Game],
+            subtree_cache: Union[SubtreeCache, None] = None,
+            outcome_store: Union[OutcomeStore, None] = None,
+            executor: Union[Executor, None] = None,
+            rng: Union[random.Random, None] = None,
+    ):
+        """Lockstep driver constructor.
+
+        Args:
+            games: games to play
+            subtree_cache: cache of etape subtrees shared by all the games, a new one if None
+            outcome_store: persistent store of etape outcomes
+            executor: executor to spread the etape evaluations of a batch over, they run in this process if None
+            rng: random generator seeding the game rollouts, a new randomly seeded one if None
+        """
+        self.games = games
+        self.subtree_cache = SubtreeCache() if subtree_cache is None else subtree_cache
+        self.outcome_store = outcome_store
+        self.executor = executor
+        self.rng = random.Random() if rng is None else rng
+        self.stats: Dict[str, int] = {'steps': 0, 'moves': 0, 'requests': 0, 'etape_evaluations': 0,
+                                      'game_evaluations': 0}
+
+    def play(self) -> None:
+        """Play all the games to the end."""
+        while self.step() > 0:
+            pass
+
+    def step(self) -> int:
+        """Play one move in every running game.
+
+        Returns:
+            number of games that moved
+        """
+        decisions = []
+        for game in self.games:
+            if game.board.game_ended:
+                continue
+            player = game.players[game.board.current_player]
+            moves = possible_game_moves(game.board, player.name, rng=game.rng)
+            decisions.append((game, player, moves, player.request_evaluation(moves, game.board)))
+        requests = [decision for game, player, moves, decision in decisions
+                    if isinstance(decision, EvaluationRequest)]
+        results = iter(self.evaluate(requests))
+        for game, player, moves, decision in decisions:
+            if isinstance(decision, EvaluationRequest):
+                etape_outcomes, game_outcomes = next(results)
+                decision = player.choose_evaluated_move(moves, game.board, etape_outcomes, game_outcomes)
+            game.step(decision)
+        if len(decisions) > 0:
+            self.stats['steps'] += 1
+            self.stats['moves'] += len(decisions)
+        return len(decisions)
+
+    def evaluate(
+            self, requests: List[EvaluationRequest]
+    ) -> List[Tuple[Dict[Tuple[str], int], Union[Dict[Tuple[str], int], None]]]:
+        """Evaluate a batch of requests, every distinct race state up to the camel colours once.
+
+        Args:
+            requests: evaluation requests of the NPCs
+
+        Returns:
+            etape outcomes and game outcomes (None if not requested) for each request
+        """
+        keys = [canonical_race_state(request.board) for request in requests]
+        etape_boards: Dict[Tuple, Tuple[Board, Dict[str, str]]] = {}
+        game_boards: Dict[Tuple, Tuple[Board, Dict[str, str], int]] = {}
+        for request, (race_state, labels) in zip(requests, keys):
+            etape_boards.setdefault(race_state, (request.board, labels))
+            if request.game_approx_number > 0:
+                board, board_labels, n = game_boards.get(race_state, (request.board, labels, 0))
+                game_boards[race_state] = (board, board_labels, max(n, request.game_approx_number))
+        self.stats['requests'] += len(requests)
+
+        # the results are kept with the canonical camels
+        etape_results = {}
+        missing = []
+        for race_state, (board, labels) in etape_boards.items():
+            cached = Simulation(board, self.outcome_store, subtree_cache=self.subtree_cache).cached_etape()
+            if cached is None:
+                missing.append(race_state)
+            else:
+                etape_results[race_state] = relabel_outcomes(cached, labels)
+        self.stats['etape_evaluations'] += len(missing)
+        if self.executor is None:
+            for race_state in missing:
+                board, labels = etape_boards[race_state]
+                outcomes = Simulation(board, self.outcome_store, subtree_cache=self.subtree_cache).simulate_etape()
+                etape_results[race_state] = relabel_outcomes(outcomes, labels)
+        else:
+            boards = [etape_boards[race_state][0] for race_state in missing]
+            for race_state, outcomes in zip(missing, self.executor.map(simulate_etape, boards)):
+                outcomes = relabel_outcomes(outcomes, etape_boards[race_state][1])
+                self.subtree_cache.put(race_state, outcomes)
+                if self.outcome_store is not None:
+                    self.outcome_store.put(race_state, outcomes)
+                etape_results[race_state] = outcomes
+
+        self.stats['game_evaluations'] += len(game_boards)
+        game_outcomes = approximate_games(
+            [board for board, labels, n in game_boards.values()],
+            [n for board, labels, n in game_boards.values()],
+            self.rng.getrandbits(64),
+        )
+        game_results = {race_state: relabel_outcomes(outcomes, labels)
+                        for (race_state, (board, labels, n)), outcomes in zip(game_boards.items(), game_outcomes)}
+
+        results = []
+        for request, (race_state, labels) in zip(requests, keys):
+            real_camels = inverse_labels(labels)
+            results.append((
+                relabel_outcomes(etape_results[race_state], real_camels),
+                relabel_outcomes(game_results[race_state], real_camels) if request.game_approx_number > 0 else None,
+            ))
+        return results
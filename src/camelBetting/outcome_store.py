@@ -0,0 +1,133 @@
+"""Module containing the disk-backed store of etape outcome distributions shared across processes and runs."""
+from camelBetting.entities.board import CAMELS
+
+import fcntl
+import hashlib
+import itertools
+import mmap
+import os
+from array import array
+from typing import Dict, Tuple, Union
+
+MAGIC = b'CAMELOS1'
+ORDERS = list(itertools.permutations(CAMELS))  # all the possible camel orders
+ORDER_INDEX = {order: i for i, order in enumerate(ORDERS)}
+KEY_SIZE = 16
+END_MARKER = b'\xca\x3e\x10\x5d'
+RECORD_SIZE = KEY_SIZE + 4 * len(ORDERS) + len(END_MARKER)
+
+
+def state_key(race_state: Tuple) -> bytes:
+    """Fixed size key of a race state.
+
+    Args:
+        race_state: race state (see Board.race_state)
+
+    Returns:
+        digest of the race state
+    """
+    return hashlib.blake2b(repr(race_state).encode(), digest_size=KEY_SIZE).digest()
+
+
+class OutcomeStore:
+    """Append-only file of etape outcome distributions keyed by the race state, read through a memory map.
+
+    Simulation stores the canonical race states (see symmetry.canonical_race_state), one record per stack
+    shape up to the camel colours.
+
+    The file is a header followed by fixed size records - the key, the number of occurrences of every camel
+    order and an end marker. Any number of processes can read the file concurrently, writers append whole
+    records under an exclusive lock. A record is indexed once it is complete, so readers never see a torn
+    record.
+    """
+
+    def __init__(self, path: str):
+        """Outcome store constructor.
+
+        Args:
+            path: path of the store file, created if it does not exist
+        """
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.write(self._fd, MAGIC)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        if os.pread(self._fd, len(MAGIC), 0) != MAGIC:
+            raise ValueError(f'{path} is not an outcome store.')
+        self._map: Union[mmap.mmap, None] = None
+        self._indexed_size = len(MAGIC)
+        self._index: Dict[bytes, int] = {}
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._index)
+
+    def get(self, race_state: Tuple) -> Union[Dict[Tuple[str], int], None]:
+        """Get the stored etape outcomes of a race state.
+
+        Args:
+            race_state: race state (see Board.race_state)
+
+        Returns:
+            camel order -> number of occurrences, None if the race state is not stored
+        """
+        key = state_key(race_state)
+        if key not in self._index:
+            self._refresh()
+            if key not in self._index:
+                return None
+        offset = self._index[key] + KEY_SIZE
+        counts = array('I')
+        counts.frombytes(self._map[offset:offset + 4 * len(ORDERS)])
+        return {ORDERS[i]: n for i, n in enumerate(counts) if n > 0}
+
+    def put(self, race_state: Tuple, outcomes: Dict[Tuple[str], int]) -> None:
+        """Append the etape outcomes of a race state unless they are stored already.
+
+        Args:
+            race_state: race state (see Board.race_state)
+            outcomes: camel order -> number of occurrences
+        """
+        key = state_key(race_state)
+        if key in self._index:
+            return
+        counts = array('I', [0] * len(ORDERS))
+        for order, n in outcomes.items():
+            counts[ORDER_INDEX[tuple(order)]] = n
+        record = key + counts.tobytes() + END_MARKER
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            os.write(self._fd, record)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        """Close the store."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        os.close(self._fd)
+
+    def _refresh(self) -> None:
+        """Map and index the records appended since the last refresh."""
+        size = os.fstat(self._fd).st_size
+        complete = len(MAGIC) + (size - len(MAGIC)) // RECORD_SIZE * RECORD_SIZE
+        if complete <= self._indexed_size:
+            return
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._fd, complete, access=mmap.ACCESS_READ)
+        for offset in range(self._indexed_size, complete, RECORD_SIZE):
+            if self._map[offset + RECORD_SIZE - len(END_MARKER):offset + RECORD_SIZE] != END_MARKER:
+                raise ValueError(f'Corrupted record at offset {offset} of {self.path}.')
+            self._index.setdefault(self._map[offset:offset + KEY_SIZE], offset)
+        self._indexed_size = complete
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
@@ -0,0 +1,264 @@
+"""Module containing the profiling entry point of the simulations and the games.
+
+Run a scenario under a profiler, save the profile and print the hottest functions of the game core, e.g.:
+
+    python -m camelBetting.profiling etape
+    python -m camelBetting.profiling tournament --games 5 --profiler sampling --output profiles/tournament
+
+cProfile writes <output>.prof (load it with pstats or snakeviz) and <output>.collapsed with caller;function
+stacks, the sampling profiler writes <output>.collapsed with the full stacks. The collapsed stacks are the input
+of flamegraph tools (flamegraph.pl, speedscope, inferno).
+"""
+from camelBetting.entities.board import Board
+from camelBetting.entities.move import DiceRoll
+from camelBetting.entities.player import RandomNpc, LessRandomNpc, EvilNpc, AdequateNpc
+from camelBetting.game import Game
+from camelBetting.simulation import Simulation
+from camelBetting.tools import block_stdout, enable_stdout
+
+import argparse
+import cProfile
+from collections import defaultdict
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+HOT_FILES = ['board.py', 'move.py', 'simulation.py']
+
+Frame = Tuple[str, int, str]  # file name, line number, function name - the key of a function in pstats
+
+
+def etape_scenario(args: argparse.Namespace) -> None:
+    """Enumerate the first etape of a game."""
+    for _ in range(args.repeat):
+        Simulation(Board(['a', 'b'])).simulate_etape()
+
+
+def approx_scenario(args: argparse.Namespace) -> None:
+    """Approximate a game from the start of its second etape by random rollouts."""
+    board = Board(['a', 'b'])
+    for camel, dice in [('yellow', 3), ('blue', 3), ('green', 2), ('orange', 1), ('white', 3)]:
+        board = DiceRoll(board, board.current_player, camel, dice).play()
+    board.reset_etape()
+    for _ in range(args.repeat):
+        Simulation(board, rng=random.Random(args.seed)).approximate_game(args.rollouts)
+
+
+def game_scenario(args: argparse.Namespace) -> None:
+    """Play a game of two evaluating NPCs."""
+    for _ in range(args.repeat):
+        Game([
+            EvilNpc('Evil Guy', threshold_for_overall_bets=8, game_approx_number=args.rollouts),
+            AdequateNpc('Adequate Guy', threshold_for_overall_bets=8, game_approx_number=args.rollouts,
+                        n_top_moves=3),
+        ]).play()
+
+
+def tournament_scenario(args: argparse.Namespace) -> None:
+    """Play a series of games of four NPCs in random seat orders."""
+    players = [
+        RandomNpc('Silly Guy', threshold_for_overall_bets=8),
+        LessRandomNpc('Less Random Guy', threshold_for_overall_bets=8),
+        EvilNpc('Evil Guy', threshold_for_overall_bets=8, game_approx_number=args.rollouts),
+        AdequateNpc('Adequate Guy', threshold_for_overall_bets=8, game_approx_number=args.rollouts, n_top_moves=3),
+    ]
+    for _ in range(args.games):
+        random.shuffle(players)
+        Game(players).play()
+
+
+SCENARIOS: Dict[str, Callable[[argparse.Namespace], None]] = {
+    'etape': etape_scenario,
+    'approx': approx_scenario,
+    'game': game_scenario,
+    'tournament': tournament_scenario,
+}
+
+
+class SamplingProfiler:
+    """Profiler sampling the stack of the profiled thread from a background thread.
+
+    The overhead does not grow with the number of calls like with cProfile, so the times of the small functions
+    called in the inner loops are not inflated. The background thread needs the GIL to take a sample, so the
+    interpreter switch interval (see sys.setswitchinterval) is lowered to the sampling interval while profiling.
+    """
+
+    def __init__(self, interval: float = 0.001):
+        """Sampling profiler constructor.
+
+        Args:
+            interval: time between two samples in seconds
+        """
+        self.interval = interval
+        self.stacks: Dict[Tuple[Frame, ...], int] = defaultdict(int)
+
+    def runcall(self, func: Callable, *args) -> None:
+        """Run a function in this thread and sample its stacks.
+
+        Args:
+            func: function to profile
+            *args: arguments of the function
+        """
+        thread_id = threading.get_ident()
+        # the frames up to this one are the same in all the samples
+        base = _depth(sys._getframe())
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(self.interval):
+                frame = sys._current_frames().get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack[:-base]))] += 1
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.interval))
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        try:
+            func(*args)
+        finally:
+            stop.set()
+            sampler.join()
+            sys.setswitchinterval(switch_interval)
+
+    def self_counts(self) -> Dict[Frame, int]:
+        """Number of samples in which a function is on the top of the stack."""
+        counts = defaultdict(int)
+        for stack, n in self.stacks.items():
+            if len(stack) > 0:
+                counts[stack[-1]] += n
+        return counts
+
+
+def _depth(frame) -> int:
+    """Number of frames in the stack up to a frame, the frame included."""
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+def _frame_name(frame: Frame) -> str:
+    """Frame name in the collapsed stacks - the frame separator of the format cannot appear in it."""
+    filename, line, name = frame
+    return f'{name} ({os.path.basename(filename)}:{line})'.replace(';', ':')
+
+
+def write_collapsed(stacks: Dict[Tuple[Frame, ...], int], path: str) -> None:
+    """Write stacks in the collapsed format of flamegraph tools - frames joined by ';' and the weight.
+
+    Args:
+        stacks: stack from the outermost frame -> weight
+        path: output file path
+    """
+    with open(path, 'w') as file:
+        for stack, weight in sorted(stacks.items(), key=lambda x: x[1], reverse=True):
+            if weight > 0 and len(stack) > 0:
+                file.write(f"{';'.join([_frame_name(frame) for frame in stack])} {weight}\n")
+
+
+def caller_stacks(stats: pstats.Stats) -> Dict[Tuple[Frame, ...], int]:
+    """Caller;function stacks of a cProfile profile weighted by the own time in microseconds.
+
+    cProfile only keeps the direct callers, so the stacks are two frames deep.
+
+    Args:
+        stats: profile statistics
+
+    Returns:
+        (caller, function) or (function,) for the top level -> own time of the function under the caller
+    """
+    stacks = {}
+    for function, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if len(callers) == 0:
+            stacks[(function,)] = int(tt * 1e6)
+        for caller, (caller_cc, caller_nc, caller_tt, caller_ct) in callers.items():
+            stacks[(caller, function)] = int(caller_tt * 1e6)
+    return stacks
+
+
+def hot_functions(stats: pstats.Stats, files: List[str], top: int) -> List[Tuple[Frame, int, float, float]]:
+    """Functions of the given files with the highest own time in a cProfile profile.
+
+    Args:
+        stats: profile statistics
+        files: base names of the files
+        top: number of functions
+
+    Returns:
+        list of (function, number of calls, own time, cumulative time) from the highest own time
+    """
+    functions = [(function, nc, tt, ct) for function, (cc, nc, tt, ct, callers) in stats.stats.items()
+                 if os.path.basename(function[0]) in files]
+    return list(sorted(functions, key=lambda x: x[2], reverse=True))[:top]
+
+
+def main(argv: List[str] = None) -> None:
+    """Profile a scenario from the command line."""
+    parser = argparse.ArgumentParser(
+        prog='python -m camelBetting.profiling',
+        description='Profile a scenario and print the hottest functions of the game core.',
+    )
+    parser.add_argument('scenario', choices=list(SCENARIOS.keys()), help='scenario to profile')
+    parser.add_argument('--profiler', choices=['cprofile', 'sampling'], default='cprofile',
+                        help='deterministic cProfile or the low overhead stack sampling')
+    parser.add_argument('--output', default=None, help='path prefix of the output files, profile-<scenario> if not set')
+    parser.add_argument('--interval', type=float, default=0.001, help='sampling interval in seconds')
+    parser.add_argument('--rollouts', type=int, default=2000, help='number of the game approximation rollouts')
+    parser.add_argument('--games', type=int, default=3, help='number of the tournament games')
+    parser.add_argument('--repeat', type=int, default=1, help='number of the scenario repetitions')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generators')
+    parser.add_argument('--top', type=int, default=15, help='number of the hot functions to print')
+    parser.add_argument('--files', nargs='+', default=HOT_FILES, help='files of the hot functions')
+    args = parser.parse_args(argv)
+
+    output = f'profile-{args.scenario}' if args.output is None else args.output
+    if os.path.dirname(output) != '':
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    random.seed(args.seed)
+    scenario = SCENARIOS[args.scenario]
+
+    # the games print every move
+    block_stdout()
+    s = time.time()
+    try:
+        if args.profiler == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.runcall(scenario, args)
+        else:
+            profiler = SamplingProfiler(args.interval)
+            profiler.runcall(scenario, args)
+    finally:
+        enable_stdout()
+    print(f'{args.scenario} scenario profiled with {args.profiler} in {time.time() - s:.2f} s')
+
+    if args.profiler == 'cprofile':
+        stats = pstats.Stats(profiler)
+        stats.dump_stats(f'{output}.prof')
+        write_collapsed(caller_stacks(stats), f'{output}.collapsed')
+        print(f'Profile saved to {output}.prof, caller;function stacks (us) to {output}.collapsed')
+        print(f"{'ncalls':>10} {'tottime':>9} {'cumtime':>9}  function")
+        for (filename, line, name), nc, tt, ct in hot_functions(stats, args.files, args.top):
+            print(f'{nc:>10} {tt:>9.3f} {ct:>9.3f}  {name} ({os.path.basename(filename)}:{line})')
+    else:
+        write_collapsed(profiler.stacks, f'{output}.collapsed')
+        total = sum(profiler.stacks.values())
+        print(f'{total} samples, stacks saved to {output}.collapsed')
+        counts = [(frame, n) for frame, n in profiler.self_counts().items()
+                  if os.path.basename(frame[0]) in args.files]
+        print(f"{'samples':>10} {'share':>7}  function")
+        for (filename, line, name), n in list(sorted(counts, key=lambda x: x[1], reverse=True))[:args.top]:
+            print(f'{n:>10} {n / max(total, 1):>7.1%}  {name} ({os.path.basename(filename)}:{line})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Module containing the policies of the players' moves in the game approximation rollouts."""
+from camelBetting.entities.board import Board
+from camelBetting.entities.stone import Stone
+
+import random
+from typing import Dict, List, Tuple, Union
+
+# turn a player spends betting in a rollout - a bet does not move the camels, so only the turn passes
+BET_TURN = 'bet'
+
+# action of the current player of a rollout: None for a dice roll drawn by the rollout, BET_TURN or the field and
+# the sign of a stone put - the policies are asked once per move of every rollout, so the actions are plain values
+# instead of Move instances
+Action = Union[Tuple[int, bool], str, None]
+
+# the stones are never changed once put, so the boards of all the rollouts share them
+_STONES: Dict[Tuple[str, bool], Stone] = {}
+
+
+class RolloutPolicy:
+    """Base RolloutPolicy class to inherit from.
+
+    A policy decides the moves other than the dice rolls that the players make in a rollout. It is asked once per
+    move of every rollout, so it decides straight from the board instead of generating the possible moves, and
+    the rollout plays its action with play_action.
+    """
+
+    # whether the policy can put stones - the rollouts cannot stop early on a decided camel order then
+    places_stones = False
+
+    def next_action(self, board: Board, rng: random.Random) -> Action:
+        """Get the next action of the current player of the rollout.
+
+        Args:
+            board: current board of the rollout
+            rng: random generator of the rollout
+
+        Returns:
+            None for a dice roll drawn by the rollout, BET_TURN or (field, positive) of a stone put
+        """
+        raise NotImplementedError()
+
+
+class RollOnlyPolicy(RolloutPolicy):
+    """Policy of players that only roll the dice, like the default approximate_game."""
+
+    def next_action(self, board: Board, rng: random.Random) -> Action:
+        return None
+
+
+class StonePlacerPolicy(RolloutPolicy):
+    """Policy of players placing their stones in front of the leader like BasicNpc and rolling otherwise.
+
+    A player whose stone is not on the board or is behind the last camel puts it on a random free field of the
+    two in front of the leader, or on the closest free field further ahead. The turns the players spend on bets
+    only pass the turn to the next player, which changes who gets to move the stones between the rolls.
+    """
+
+    places_stones = True
+
+    def __init__(self, players: Union[List[str], None] = None, bet_share: float = 0.0):
+        """Stone placer policy constructor.
+
+        Args:
+            players: players placing the stones, all the players if None
+            bet_share: share of the turns without a stone put that the players spend on bets
+        """
+        if not 0 <= bet_share < 1:
+            raise ValueError(f'Invalid bet share: {bet_share}')
+        self.players = None if players is None else set(players)
+        self.bet_share = bet_share
+
+    def next_action(self, board: Board, rng: random.Random) -> Action:
+        player = board.current_player
+        if self.players is not None and player not in self.players:
+            return None
+        leader = 0
+        last = 17
+        for field, height in board.camel_positions.values():
+            leader = max(leader, field)
+            last = min(last, field)
+        own = None
+        for field, stone in board.stones.items():
+            if stone.player == player:
+                own = field
+        if own is None or own < last:
+            ideal = _free_field(board, leader + 1) + _free_field(board, leader + 2)
+            if ideal == 2:
+                return leader + 1 + rng.randrange(2), rng.random() < 0.5
+            if ideal == 1:
+                field = leader + 1 if _free_field(board, leader + 1) else leader + 2
+                return field, rng.random() < 0.5
+            for field in range(leader + 3, 17):
+                if _free_field(board, field):
+                    return field, True
+        if self.bet_share > 0 and rng.random() < self.bet_share:
+            return BET_TURN
+        return None
+
+
+class MixedPolicy(RolloutPolicy):
+    """Policy drawing every move from one of several policies by their weights."""
+
+    def __init__(self, policies: List[RolloutPolicy], weights: List[float]):
+        """Mixed policy constructor.
+
+        Args:
+            policies: policies to mix
+            weights: weights of the policies
+        """
+        if len(policies) != len(weights) or len(policies) == 0:
+            raise ValueError('The policies and the weights must be non-empty and of the same length')
+        self.policies = policies
+        total = sum(weights)
+        self.cumulative_weights = []
+        cumulative = 0
+        for weight in weights:
+            cumulative += weight / total
+            self.cumulative_weights.append(cumulative)
+        self.places_stones = any([policy.places_stones for policy in policies])
+
+    def next_action(self, board: Board, rng: random.Random) -> Action:
+        r = rng.random()
+        for policy, cumulative in zip(self.policies, self.cumulative_weights):
+            if r < cumulative:
+                return policy.next_action(board, rng)
+        return self.policies[-1].next_action(board, rng)
+
+
+def play_action(board: Board, action: Action) -> None:
+    """Play a bet turn or a stone put of the current player on the board in place, like StonePut.play would.
+
+    Args:
+        board: board owned by the rollout
+        action: BET_TURN or (field, positive) of a stone put available on the board
+    """
+    if action != BET_TURN:
+        field, positive = action
+        player = board.current_player
+        stones = board._writable('stones')
+        for stone_field, stone in stones.items():
+            if stone.player == player:
+                stones.pop(stone_field)
+                break
+        stone = _STONES.get((player, positive))
+        if stone is None:
+            stone = _STONES[(player, positive)] = Stone(player, positive)
+        stones[field] = stone
+    board.next_player()
+
+
+def _free_field(board: Board, field: int) -> bool:
+    """Whether a stone can be put on a field (see StonePut.available)."""
+    stones = board.stones
+    return 1 < field <= 16 and field not in stones and field - 1 not in stones and field + 1 not in stones
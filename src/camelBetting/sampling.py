@@ -0,0 +1,169 @@
+"""Module containing the dice samplers for the game approximation rollouts."""
+from camelBetting.entities.board import Board, CAMELS
+from camelBetting.simulation import Simulation
+
+import random
+from math import factorial
+from typing import Callable, Dict, List, Tuple, Union
+
+
+class RolloutSampler:
+    """Base RolloutSampler class to inherit from."""
+
+    def start_rollout(self, board: Board, index: int, total: int) -> None:
+        """Prepare the sampler for a new rollout.
+
+        Args:
+            board: board the rollout starts from
+            index: index of the rollout
+            total: total number of rollouts
+        """
+        raise NotImplementedError()
+
+    def next_roll(self, board: Board) -> Tuple[str, int]:
+        """Get the next dice roll of the rollout.
+
+        Args:
+            board: current board of the rollout
+
+        Returns:
+            camel to roll and the dice value
+        """
+        raise NotImplementedError()
+
+
+class IndependentSampler(RolloutSampler):
+    """Sampler drawing every roll independently, like the default approximate_game."""
+
+    def __init__(self, rng: Union[random.Random, None] = None):
+        """Independent sampler constructor.
+
+        Args:
+            rng: random generator of the rolls, a new randomly seeded one if None
+        """
+        self.rng = random.Random() if rng is None else rng
+
+    def start_rollout(self, board: Board, index: int, total: int) -> None:
+        pass
+
+    def next_roll(self, board: Board) -> Tuple[str, int]:
+        return self.rng.choice(board.camels_to_roll), self.rng.choice([1, 2, 3])
+
+
+class StratifiedSampler(RolloutSampler):
+    """Sampler stratifying the roll order and dice values of every etape.
+
+    All the roll sequences of an etape are numbered so that the first roll is the most significant digit and
+    the numbering is split into one stratum per rollout. Every rollout draws the sequence of the current etape
+    from its own stratum and the strata of the later etapes are assigned by a random permutation per etape
+    (latin hypercube). The streams only depend on the seed and the rollout index, so reusing the sampler for
+    several boards or candidate moves uses common random numbers for all of them.
+
+    The gain is in the comparisons - the difference between two boards approximated with the same sampler
+    needs about 3-4 times fewer rollouts for the same precision (see test.test_samplers). The estimate for a
+    single board only needs about 1.2-2 times fewer rollouts, because the final order depends on the rolls of
+    several etapes together and the strata only balance every etape on its own.
+    """
+
+    def __init__(self, seed: Union[int, None] = None):
+        """Stratified sampler constructor.
+
+        Args:
+            seed: seed of the random streams, random if None
+        """
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self._rng = random.Random()
+        self._permutations: Dict[Tuple[int, int], List[int]] = {}
+        self._index = 0
+        self._total = 1
+        self._etape = 0
+        self._etape_rolls: List[Tuple[str, int]] = []
+
+    def reseed(self, seed: Union[int, None] = None) -> None:
+        """Change the seed of the random streams.
+
+        Args:
+            seed: new seed, random if None
+        """
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self._permutations = {}
+
+    def start_rollout(self, board: Board, index: int, total: int) -> None:
+        self._rng.seed(self.seed * 1000003 + index)
+        self._index = index
+        self._total = total
+        self._etape = 0
+        self._etape_rolls = self._stratified_rolls([camel for camel in CAMELS if camel in board.camels_to_roll])
+
+    def next_roll(self, board: Board) -> Tuple[str, int]:
+        if len(self._etape_rolls) == 0:
+            self._etape += 1
+            self._etape_rolls = self._stratified_rolls([camel for camel in CAMELS if camel in board.camels_to_roll])
+        return self._etape_rolls.pop(0)
+
+    def _stratified_rolls(self, camels: List[str]) -> List[Tuple[str, int]]:
+        """Draw the roll sequence of the current etape of the rollout from its stratum."""
+        key = (self._total, self._etape)
+        if key not in self._permutations:
+            if self._etape == 0:
+                self._permutations[key] = list(range(self._total))
+            else:
+                self._permutations[key] = random.Random(self.seed * 1000003 - self._etape).sample(
+                    range(self._total), self._total
+                )
+        stratum = self._permutations[key][self._index]
+        size = factorial(len(camels)) * 3 ** len(camels)
+        sequence = int((stratum + self._rng.random()) / self._total * size)
+        rolls = []
+        while len(camels) > 0:
+            size //= len(camels)
+            camel_index, sequence = divmod(sequence, size)
+            size //= 3
+            dice_index, sequence = divmod(sequence, size)
+            rolls.append((camels.pop(camel_index), dice_index + 1))
+        return rolls
+
+
+def winner_spread(
+        board: Board,
+        sampler_factory: Callable[[], Union[RolloutSampler, None]],
+        number_of_approximations: int,
+        repeats: int,
+        other_board: Union[Board, None] = None,
+) -> float:
+    """Measure the precision of a sampler as the spread of the estimated overall winner probabilities.
+
+    Args:
+        board: board to approximate the game from
+        sampler_factory: function creating a fresh sampler for every repeat (returning None is the default sampler)
+        number_of_approximations: number of rollouts of one estimate
+        repeats: number of independent estimates
+        other_board: if given, the spread of the difference between the estimates for the two boards is measured,
+            both boards are approximated with the same sampler
+
+    Returns:
+        standard deviation of the winner probability estimates averaged over the camels
+    """
+    estimates: Dict[str, List[float]] = {camel: [] for camel in CAMELS}
+    for _ in range(repeats):
+        sampler = sampler_factory()
+        probabilities = _winner_probabilities(board, sampler, number_of_approximations)
+        if other_board is not None:
+            other = _winner_probabilities(other_board, sampler, number_of_approximations)
+            probabilities = {camel: probabilities[camel] - other[camel] for camel in CAMELS}
+        for camel in CAMELS:
+            estimates[camel].append(probabilities[camel])
+    spreads = []
+    for values in estimates.values():
+        mean = sum(values) / len(values)
+        spreads.append((sum([(value - mean) ** 2 for value in values]) / (len(values) - 1)) ** 0.5)
+    return sum(spreads) / len(spreads)
+
+
+def _winner_probabilities(
+        board: Board, sampler: Union[RolloutSampler, None], number_of_approximations: int
+) -> Dict[str, float]:
+    """Estimate the overall winner probabilities of the camels."""
+    outcomes = Simulation(board).approximate_game(number_of_approximations, sampler)
+    return {camel: sum([n for outcome, n in outcomes.items() if outcome[0] == camel]) / number_of_approximations
+            for camel in CAMELS}
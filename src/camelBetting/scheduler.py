@@ -0,0 +1,174 @@
+"""Module containing the per-move time budget scheduler of the evaluation engines."""
+from camelBetting.entities.board import CAMELS
+from camelBetting.simulation import Simulation
+from camelBetting.surrogate import SurrogateModel
+
+from collections import defaultdict
+from math import factorial
+import time
+from typing import Callable, Dict, Tuple, Union
+
+ETAPE_ENGINES = ['cached', 'exact', 'sampled', 'heuristic']
+GAME_ENGINES = ['surrogate', 'sampled', 'skipped']
+
+
+class MoveScheduler:
+    """Scheduler running the most accurate evaluation engine that fits in the time budget of a move.
+
+    The etape outcomes come from the cache of a previous enumeration if there is one, from the exact
+    enumeration if its estimated time fits, from as many rollouts to the end of the etape as fit, or else from
+    the current camel order. The overall winner and loser probabilities come from the surrogate model if it is
+    accurate enough, from as many game rollouts as fit, from the surrogate model anyway, or are skipped.
+
+    The time of an enumerated leaf and of a rollout are calibrated from the finished runs - an estimate rises to
+    a slower run at once and follows faster runs with an exponential moving average, so that a move keeps to
+    its budget even when the evaluations get more expensive.
+    """
+
+    def __init__(
+            self,
+            move_budget: float,
+            etape_share: float = 0.5,
+            min_rollouts: int = 50,
+            max_etape_rollouts: int = 5000,
+            smoothing: float = 0.3,
+    ):
+        """Move scheduler constructor.
+
+        Args:
+            move_budget: wall-clock time budget of one move in seconds
+            etape_share: share of the budget for the etape outcomes when the overall bets are evaluated too
+            min_rollouts: minimal number of rollouts worth running, a cheaper engine is used otherwise
+            max_etape_rollouts: number of rollouts after which the sampled etape outcomes are precise enough
+            smoothing: weight of the last run in the calibration
+        """
+        self.move_budget = move_budget
+        self.etape_share = etape_share
+        self.min_rollouts = min_rollouts
+        self.max_etape_rollouts = max_etape_rollouts
+        self.smoothing = smoothing
+        # initial estimates of the costs in seconds, calibrated by the runs
+        self.costs = {'leaf': 2e-5, 'etape_rollout': 1e-4, 'game_rollout': 1e-3}
+        self.last_engines: Dict[str, str] = {}
+        self._deadline = 0.0
+
+    def start_move(self) -> None:
+        """Start the budget of a new move."""
+        self._deadline = time.perf_counter() + self.move_budget
+        self.last_engines = {}
+
+    def remaining(self) -> float:
+        """Remaining time of the move budget in seconds."""
+        return max(self._deadline - time.perf_counter(), 0.0)
+
+    def etape_outcomes(self, simulation: Simulation, overall_bets: bool = False) -> Dict[Tuple[str], int]:
+        """Etape outcomes from the most accurate engine that fits in the budget.
+
+        Args:
+            simulation: simulation of the current board
+            overall_bets: whether the overall bets are evaluated after the etape, which leaves them a share of
+                the budget
+
+        Returns:
+            camel order -> number of occurrences
+        """
+        budget = self.remaining() * (self.etape_share if overall_bets else 1.0)
+        outcomes = simulation.cached_etape()
+        if outcomes is not None:
+            self.last_engines['etape'] = 'cached'
+            return outcomes
+
+        rolls = len(simulation.init_board.camels_to_roll)
+        leaves = factorial(rolls) * 3 ** rolls
+        if leaves * self.costs['leaf'] <= budget:
+            start = time.perf_counter()
+            outcomes = simulation.simulate_etape()
+            self._calibrate('leaf', (time.perf_counter() - start) / leaves)
+            self.last_engines['etape'] = 'exact'
+            return outcomes
+
+        outcomes = self._sample(simulation.approximate_etape, 'etape_rollout', self.max_etape_rollouts, budget)
+        if outcomes is not None:
+            self.last_engines['etape'] = 'sampled'
+            return outcomes
+
+        self.last_engines['etape'] = 'heuristic'
+        return defaultdict(int, {simulation.init_board.current_camel_order: 1})
+
+    def game_probabilities(
+            self,
+            simulation: Simulation,
+            number_of_approximations: int,
+            surrogate: Union[SurrogateModel, None] = None,
+            surrogate_error_bound: Union[float, None] = None,
+    ) -> Union[Tuple[Dict[str, float], Dict[str, float]], None]:
+        """Overall winner and loser probabilities from the most accurate engine that fits in the budget.
+
+        Args:
+            simulation: simulation of the current board
+            number_of_approximations: maximal number of game rollouts
+            surrogate: surrogate model of the probabilities, None if there is none
+            surrogate_error_bound: the surrogate model is preferred when its expected error is at most this
+                bound, None to only use it when no rollouts fit
+
+        Returns:
+            camel -> winner probability, camel -> loser probability, None if no engine fits
+        """
+        board = simulation.init_board
+        if surrogate is not None and surrogate_error_bound is not None \
+                and surrogate.error(board) <= surrogate_error_bound:
+            self.last_engines['game'] = 'surrogate'
+            return surrogate.predict(board)
+
+        outcomes = self._sample(simulation.approximate_game, 'game_rollout', number_of_approximations,
+                                self.remaining())
+        if outcomes is not None:
+            self.last_engines['game'] = 'sampled'
+            n = sum(outcomes.values())
+            win_probs = {camel: 0.0 for camel in CAMELS}
+            lose_probs = {camel: 0.0 for camel in CAMELS}
+            for order, count in outcomes.items():
+                win_probs[order[0]] += count / n
+                lose_probs[order[-1]] += count / n
+            return win_probs, lose_probs
+
+        if surrogate is not None:
+            self.last_engines['game'] = 'surrogate'
+            return surrogate.predict(board)
+        self.last_engines['game'] = 'skipped'
+        return None
+
+    def _sample(
+            self, approximate: Callable[[int], Dict[Tuple[str], int]], cost: str, max_rollouts: int, budget: float
+    ) -> Union[Dict[Tuple[str], int], None]:
+        """Run as many rollouts as fit in the budget - a first batch calibrates the cost of the rest.
+
+        Args:
+            approximate: function running a number of rollouts
+            cost: name of the rollout cost
+            max_rollouts: maximal number of rollouts
+            budget: time budget in seconds
+
+        Returns:
+            camel order -> number of rollouts, None if not even the minimal number of rollouts fits
+        """
+        if min(int(budget / self.costs[cost]), max_rollouts) < self.min_rollouts:
+            return None
+        start = time.perf_counter()
+        outcomes = approximate(self.min_rollouts)
+        elapsed = time.perf_counter() - start
+        self._calibrate(cost, elapsed / self.min_rollouts)
+        n = min(int((budget - elapsed) / self.costs[cost]), max_rollouts - self.min_rollouts)
+        if n > 0:
+            start = time.perf_counter()
+            for order, count in approximate(n).items():
+                outcomes[order] += count
+            self._calibrate(cost, (time.perf_counter() - start) / n)
+        return outcomes
+
+    def _calibrate(self, cost: str, observed: float) -> None:
+        """Update the cost estimate with an observed cost - it rises at once and falls gradually."""
+        if observed >= self.costs[cost]:
+            self.costs[cost] = observed
+        else:
+            self.costs[cost] = (1 - self.smoothing) * self.costs[cost] + self.smoothing * observed
@@ -0,0 +1,98 @@
+"""Module containing the asyncio analysis service ranking the moves of board positions."""
+from camelBetting.entities.board import Board
+from camelBetting.entities.move import BetOverall
+from camelBetting.entities.move_generators import possible_game_moves
+from camelBetting.simulation import Simulation
+
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Tuple, Union
+
+
+def rank_moves(board: Board, threshold_for_overall_bets: int, game_approx_number: int) -> List[Tuple[str, float]]:
+    """Rank the moves of the current player by their expected value.
+
+    Args:
+        board: board to analyse
+        threshold_for_overall_bets: field the leading camel has to reach for overall bets to be evaluated
+        game_approx_number: number of simulations for game approximation
+
+    Returns:
+        list of (move shortcut, expected value) sorted from the best move
+    """
+    moves = possible_game_moves(board, board.current_player)
+    camel_pos = [x[0] for x in board.camel_positions.values()]
+    sim = Simulation(board)
+    etape_outcomes = sim.simulate_etape()
+    move_evs = [(move.shortcut, move.expected_value(etape_outcomes)) for move in moves
+                if not isinstance(move, BetOverall)]
+    if max(camel_pos) >= threshold_for_overall_bets:
+        game_approx = sim.approximate_game(game_approx_number)
+        move_evs += [(move.shortcut, move.expected_value(game_approx)) for move in moves
+                     if isinstance(move, BetOverall)]
+    return list(sorted(move_evs, key=lambda x: x[1], reverse=True))
+
+
+class AnalysisService:
+    """In-process asyncio service answering "evaluate this board" queries.
+
+    Identical queries that arrive while the position is being evaluated share the same evaluation, so the CPU
+    work grows with the number of distinct positions and not with the number of queries. The evaluations run
+    in a process pool.
+    """
+
+    def __init__(
+            self,
+            threshold_for_overall_bets: int = 8,
+            game_approx_number: int = 5000,
+            max_workers: Union[int, None] = None,
+            executor: Union[Executor, None] = None,
+    ):
+        """Analysis service constructor.
+
+        Args:
+            threshold_for_overall_bets: field the leading camel has to reach for overall bets to be evaluated
+            game_approx_number: number of simulations for game approximation
+            max_workers: number of worker processes, ignored when executor is given
+            executor: executor to run the evaluations in, a process pool is created if None
+        """
+        self.threshold_for_overall_bets = threshold_for_overall_bets
+        self.game_approx_number = game_approx_number
+        self._own_executor = executor is None
+        self._executor = ProcessPoolExecutor(max_workers) if executor is None else executor
+        self._in_flight: Dict[Tuple, asyncio.Future] = {}
+        self.stats: Dict[str, int] = {'requests': 0, 'evaluations': 0}
+
+    async def analyse(self, board: Board) -> List[Tuple[str, float]]:
+        """Rank the moves of the current player.
+
+        Args:
+            board: board to analyse
+
+        Returns:
+            list of (move shortcut, expected value) sorted from the best move
+        """
+        self.stats['requests'] += 1
+        key = board.position_key
+        future = self._in_flight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._executor, rank_moves, board.copy(), self.threshold_for_overall_bets, self.game_approx_number
+            )
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self.stats['evaluations'] += 1
+        # shielded, so that a cancelled query does not cancel the evaluation for the others
+        return await asyncio.shield(future)
+
+    def close(self) -> None:
+        """Shut down the worker pool if it is owned by the service."""
+        if self._own_executor:
+            self._executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
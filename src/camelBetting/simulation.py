@@ -2,59 +2,282 @@ import multiprocessing
 import sys
 import resource
 
-from camelBetting.entities.board import Board
-from camelBetting.entities.move import Move
+from camelBetting.dominance import etape_order_decided, game_can_end_within, game_ends_in_etape, independent_groups
+from camelBetting.entities.board import Board, CAMELS
+from camelBetting.entities.move import Move, DiceRoll
 from camelBetting.entities.move_generators import simulation_moves
-from camelBetting.tools import block_stdout, enable_stdout
+from camelBetting.outcome_store import OutcomeStore
+from camelBetting.rollout_policies import RolloutPolicy, play_action
+from camelBetting.subtree_cache import SubtreeCache
+from camelBetting.symmetry import canonical_race_state, relabel_outcomes, inverse_labels
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import itertools
 import random
-from typing import Dict, Tuple
+from math import factorial
+from typing import Dict, Tuple, List, Union
 
 import threading
 
+# the RolloutSampler annotations are strings - camelBetting.sampling imports this module
+
 resource.setrlimit(resource.RLIMIT_STACK, (2 ** 29, -1))
 sys.setrecursionlimit(10 ** 6)
 
 
 class Simulation:
-    def __init__(self, init_board: Board):
+    """Simulations of the race from a board.
+
+    The simulation has no global side effects - it draws from its own random generator and does not touch
+    sys.stdout - so several simulations can run concurrently in threads.
+    """
+
+    def __init__(
+            self,
+            init_board: Board,
+            outcome_store: Union[OutcomeStore, None] = None,
+            rng: Union[random.Random, None] = None,
+            subtree_cache: Union[SubtreeCache, None] = None,
+            rollout_policy: Union[RolloutPolicy, None] = None,
+    ):
+        """Simulation constructor.
+
+        Args:
+            init_board: board to simulate from
+            outcome_store: persistent store of etape outcomes checked before simulating an etape
+            rng: random generator of the rollouts, a new randomly seeded one if None
+            subtree_cache: cache of etape subtrees checked first and filled when simulating an etape
+            rollout_policy: policy of the players' moves other than the dice rolls in the game rollouts, the
+                players only roll the dice if None
+        """
         self.init_board = init_board
-        self.etape_limit = None
+        self.outcome_store = outcome_store
+        self.rng = random.Random() if rng is None else rng
+        self.subtree_cache = subtree_cache
+        self.rollout_policy = rollout_policy
+
+    def cached_etape(self) -> Union[Dict[Tuple[str], int], None]:
+        """Look up the etape outcomes in the subtree cache and the outcome store without simulating.
+
+        Both are keyed by the canonical race state (see symmetry.canonical_race_state), so an etape is found
+        for any board with the same stacks up to the camel colours.
+
+        Returns:
+            camel order -> number of occurrences, None if the etape is not cached
+        """
+        race_state, labels = canonical_race_state(self.init_board)
+        outcomes = None
+        if self.subtree_cache is not None:
+            outcomes = self.subtree_cache.get(race_state)
+        if outcomes is None and self.outcome_store is not None:
+            outcomes = self.outcome_store.get(race_state)
+            if outcomes is not None and self.subtree_cache is not None:
+                self.subtree_cache.put(race_state, outcomes)
+        if outcomes is None:
+            return None
+        return defaultdict(int, relabel_outcomes(outcomes, inverse_labels(labels)))
 
     def simulate_etape(self) -> Dict[Tuple[str], int]:
+        cached = self.cached_etape()
+        if cached is not None:
+            return cached
         board = self.init_board.copy()
         outcomes = defaultdict(int)
-        block_stdout()
         self._simulate_etape(board, outcomes)
-        enable_stdout()
+        if self.outcome_store is not None or self.subtree_cache is not None:
+            race_state, labels = canonical_race_state(self.init_board)
+            canonical_outcomes = relabel_outcomes(outcomes, labels)
+            if self.outcome_store is not None:
+                self.outcome_store.put(race_state, canonical_outcomes)
+            if self.subtree_cache is not None:
+                self.subtree_cache.put(race_state, canonical_outcomes)
         return outcomes
 
     def simulate_game(self, etape_limit: int) -> Dict[Tuple[str], int]:
-        self.etape_limit = self.init_board.etape + etape_limit
         board = self.init_board.copy()
         outcomes = defaultdict(int)
-        block_stdout()
-        self._simulate_game(board, outcomes)
-        enable_stdout()
+        self._simulate_game(board, outcomes, self.init_board.etape + etape_limit)
+        return outcomes
+
+    def approximate_etape(self, number_of_approximations: int) -> Dict[Tuple[str], int]:
+        """Approximate the etape outcomes by random rollouts to the end of the etape.
+
+        Args:
+            number_of_approximations: number of rollouts
+
+        Returns:
+            camel order at the end of the etape -> number of rollouts
+        """
+        outcomes = defaultdict(int)
+        for _ in range(number_of_approximations):
+            board = self.init_board.copy()
+            order = None
+            while not board.etape_ended:
+                order = etape_order_decided(board)
+                if order is not None:
+                    break
+                board = self.rng.choice(simulation_moves(board)).play(True)
+            outcomes[board.current_camel_order if order is None else order] += 1
         return outcomes
 
-    def approximate_game(self, number_of_approximations: int) -> Dict[Tuple[str], int]:
-        block_stdout()
+    def approximate_game(
+            self, number_of_approximations: int, sampler: Union['RolloutSampler', None] = None
+    ) -> Dict[Tuple[str], int]:
+        """Approximate the game outcomes by random rollouts.
+
+        Args:
+            number_of_approximations: number of rollouts
+            sampler: RolloutSampler choosing the dice rolls, every roll is drawn independently if None - a
+                StratifiedSampler mostly pays off when the same sampler approximates the compared boards
+
+        Returns:
+            camel order at the end of the game -> number of rollouts
+        """
         outcomes = defaultdict(int)
         for i in range(number_of_approximations):
             board = self.init_board.copy()
-            while not board.game_ended:
-                possible_moves = simulation_moves(board)
-                move = random.choice(possible_moves)
-                board = move.play(True)
-                if board.etape_ended:
-                    board.reset_etape(simulation=True)
-            outcomes[board.current_camel_order] += 1
-        enable_stdout()
+            if sampler is not None:
+                sampler.start_rollout(board, i, number_of_approximations)
+            outcomes[self._rollout(board, sampler)] += 1
+        return outcomes
+
+    def parallel_approximate_game(
+            self, number_of_approximations: int, workers: int, backend: str = 'thread'
+    ) -> Dict[Tuple[str], int]:
+        """Approximate the game outcomes by random rollouts split over a pool of workers.
+
+        Every worker gets its own simulation with a random generator seeded from this simulation's one, so the
+        result is reproducible for a seeded generator. Threads avoid pickling the boards and scale on
+        free-threaded Python builds, processes scale on the others.
+
+        Args:
+            number_of_approximations: number of rollouts
+            workers: number of workers
+            backend: 'thread' or 'process'
+
+        Returns:
+            camel order at the end of the game -> number of rollouts
+        """
+        if backend == 'thread':
+            executor = ThreadPoolExecutor(workers)
+        elif backend == 'process':
+            executor = ProcessPoolExecutor(workers)
+        else:
+            raise ValueError(f'Invalid backend: {backend}')
+        chunks = [number_of_approximations // workers + (1 if i < number_of_approximations % workers else 0)
+                  for i in range(workers)]
+        seeds = [self.rng.getrandbits(64) for _ in chunks]
+        outcomes = defaultdict(int)
+        with executor:
+            for chunk_outcomes in executor.map(
+                    _approximate_chunk, [self.init_board] * workers, chunks, seeds, [self.rollout_policy] * workers
+            ):
+                for order, n in chunk_outcomes.items():
+                    outcomes[order] += n
         return outcomes
 
-    def _simulate_etape(self, board: Board, outcomes: Dict[Tuple[str], int]) -> Dict[Tuple[str], int]:
+    def hybrid_game(
+            self, number_of_approximations: int, sampler: Union['RolloutSampler', None] = None
+    ) -> Dict[Tuple[str], int]:
+        """Approximate the game outcomes exactly for the current etape and by random rollouts after it.
+
+        The end states of the current etape are enumerated and merged, the rollouts are spread over them in
+        proportion to their weights (systematic sampling) and start from the next etape. The rollout policy only
+        plays in the rollouts, the current etape is enumerated with the dice rolls alone. A sampler stratifies the
+        rollouts of every end state on their own, so each end state gets rollouts from all its strata.
+
+        Args:
+            number_of_approximations: number of rollouts
+            sampler: RolloutSampler choosing the dice rolls, every roll is drawn independently if None - a
+                StratifiedSampler mostly pays off when the same sampler approximates the compared boards
+
+        Returns:
+            camel order at the end of the game -> number of rollouts
+        """
+        end_states: Dict[Tuple, List] = {}
+        self._collect_etape_ends(self.init_board.copy(), end_states)
+        total = sum([weight for board, weight in end_states.values()])
+        outcomes = defaultdict(int)
+        offset = self.rng.random()
+        cumulative = 0
+        for end_board, weight in end_states.values():
+            first = int(cumulative * number_of_approximations / total + offset)
+            cumulative += weight
+            count = int(cumulative * number_of_approximations / total + offset) - first
+            if count == 0:
+                continue
+            if end_board.game_ended:
+                outcomes[end_board.current_camel_order] += count
+                continue
+            end_board.reset_etape(simulation=True)
+            for j in range(count):
+                board = end_board.copy(simulation=True)
+                if sampler is not None:
+                    sampler.start_rollout(board, j, count)
+                outcomes[self._rollout(board, sampler)] += 1
+        return outcomes
+
+    def _rollout(self, board: Board, sampler: Union['RolloutSampler', None] = None) -> Tuple[str]:
+        """Play random dice rolls and the moves of the rollout policy until the end of the game and get the final
+        camel order.
+
+        The rollout stops as soon as the game surely ends in the etape and the camel order cannot change any more,
+        unless the rollout policy can still put stones.
+        """
+        policy = self.rollout_policy
+        stop_early = policy is None or not policy.places_stones
+        while not board.game_ended:
+            if stop_early and game_ends_in_etape(board):
+                order = etape_order_decided(board)
+                if order is not None:
+                    return order
+            action = None if policy is None else policy.next_action(board, self.rng)
+            if action is not None:
+                # the callers pass a copy of their board, so the stones and the turn are changed in place
+                play_action(board, action)
+                continue
+            if sampler is None:
+                possible_moves = simulation_moves(board)
+                move = self.rng.choice(possible_moves)
+            else:
+                camel, dice = sampler.next_roll(board)
+                move = DiceRoll(board, board.current_player, camel, dice)
+            board = move.play(True)
+            if board.etape_ended:
+                board.reset_etape(simulation=True)
+        return board.current_camel_order
+
+    def _collect_etape_ends(self, board: Board, end_states: Dict[Tuple, List]) -> None:
+        """Enumerate the etape and merge its identical end states with their probability weights."""
+        for move in simulation_moves(board):
+            board = move.play(True)
+            if board.etape_ended:
+                # an etape cut short by the end of the game stands for all the roll sequences it would have had
+                weight = factorial(len(board.camels_to_roll)) * 3 ** len(board.camels_to_roll)
+                key = board.race_state
+                if key in end_states:
+                    end_states[key][1] += weight
+                else:
+                    end_states[key] = [board, weight]
+            else:
+                self._collect_etape_ends(board, end_states)
+
+    def _simulate_etape(
+            self, board: Board, outcomes: Dict[Tuple[str], int], depth: int = 0
+    ) -> Dict[Tuple[str], int]:
+        rolls = len(board.camels_to_roll)
+        if rolls == 1 or rolls > 1 and not game_can_end_within(board, rolls):
+            # every roll sequence is played to the end of the etape, so a decided order takes all the leaves
+            order = etape_order_decided(board)
+            if order is not None:
+                outcomes[order] += factorial(rolls) * 3 ** rolls
+                return outcomes
+            if rolls > 1:
+                groups = independent_groups(board)
+                if sum([any([camel in board.camels_to_roll for camel in group]) for group in groups]) > 1:
+                    return self._simulate_groups(board, groups, outcomes, depth)
+
         possible_moves = simulation_moves(board)
 
         # for move in possible_moves:
@@ -62,15 +285,70 @@ class Simulation:
         #     thread.daemon = True
         #     thread.start()
 
+        save_subtrees = self.subtree_cache is not None and depth < self.subtree_cache.depth
         for move in possible_moves:
             board = move.play(True)
             if board.etape_ended:
                 outcomes[board.current_camel_order] += 1
+            elif save_subtrees:
+                race_state, labels = canonical_race_state(board)
+                subtree_outcomes = self.subtree_cache.get(race_state)
+                if subtree_outcomes is None:
+                    subtree_outcomes = self._simulate_etape(board, defaultdict(int), depth + 1)
+                    self.subtree_cache.put(race_state, relabel_outcomes(subtree_outcomes, labels))
+                else:
+                    subtree_outcomes = relabel_outcomes(subtree_outcomes, inverse_labels(labels))
+                for order, n in subtree_outcomes.items():
+                    outcomes[order] += n
             else:
-                self._simulate_etape(board, outcomes)
+                self._simulate_etape(board, outcomes, depth + 1)
         return outcomes
 
-    def _simulate_game(self, board: Board, outcomes: Dict[Tuple[str], int]) -> Dict[Tuple[str], int]:
+    def _simulate_groups(
+            self, board: Board, groups: List[List[str]], outcomes: Dict[Tuple[str], int], depth: int
+    ) -> Dict[Tuple[str], int]:
+        """Enumerate the etape of independent camel groups separately and combine their outcomes.
+
+        Every combination of the group roll sequences stands for all their interleavings.
+        """
+        group_outcomes = []
+        interleavings = factorial(len(board.camels_to_roll))
+        for group in groups:
+            group_board = board.copy(simulation=True)
+            group_board.camels_to_roll = [camel for camel in board.camels_to_roll if camel in group]
+            interleavings //= factorial(len(group_board.camels_to_roll))
+            tallies = defaultdict(int)
+            if len(group_board.camels_to_roll) == 0:
+                tallies[board.current_camel_order] = 1
+            else:
+                self._simulate_etape(group_board, tallies, depth)
+            restricted = defaultdict(int)
+            for order, n in tallies.items():
+                restricted[tuple([camel for camel in order if camel in group])] += n
+            group_outcomes.append(list(restricted.items()))
+        for combination in itertools.product(*group_outcomes):
+            n = interleavings
+            for group_order, group_n in combination:
+                n *= group_n
+            outcomes[sum([group_order for group_order, group_n in combination], ())] += n
+        return outcomes
+
+    def _simulate_game(
+            self, board: Board, outcomes: Dict[Tuple[str], int], etape_limit: int
+    ) -> Dict[Tuple[str], int]:
+        rolls = len(board.camels_to_roll)
+        full_etapes = etape_limit - board.etape - 1
+        if rolls > 0 and not game_can_end_within(board, rolls + full_etapes * len(CAMELS)):
+            # no camel can finish before the etape limit, all the leaves are unfinished games
+            leaves = factorial(rolls) * 3 ** rolls * (factorial(len(CAMELS)) * 3 ** len(CAMELS)) ** full_etapes
+            outcomes['?'] += leaves
+            return outcomes
+        if rolls == 1 and game_ends_in_etape(board):
+            order = etape_order_decided(board)
+            if order is not None:
+                outcomes[order] += 3
+                return outcomes
+
         possible_moves = simulation_moves(board)
 
         for move in possible_moves:
@@ -79,8 +357,16 @@ class Simulation:
                 board.reset_etape(simulation=True)
             if board.game_ended:
                 outcomes[board.current_camel_order] += 1
-            elif board.etape >= self.etape_limit:
+            elif board.etape >= etape_limit:
                 outcomes['?'] += 1
             else:
-                self._simulate_game(board, outcomes)
+                self._simulate_game(board, outcomes, etape_limit)
         return outcomes
+
+
+def _approximate_chunk(
+        board: Board, number_of_approximations: int, seed: int, rollout_policy: Union[RolloutPolicy, None] = None
+) -> Dict[Tuple[str], int]:
+    """Approximate the game in a worker of Simulation.parallel_approximate_game."""
+    simulation = Simulation(board, rng=random.Random(seed), rollout_policy=rollout_policy)
+    return dict(simulation.approximate_game(number_of_approximations))
@@ -0,0 +1,64 @@
+"""Module containing the in-memory cache of etape subtree outcomes reused across the decisions of a game."""
+from collections import OrderedDict
+from typing import Dict, Tuple, Union
+
+
+class SubtreeCache:
+    """Bounded LRU cache of etape outcome tallies keyed by the race state.
+
+    When a simulation enumerates an etape it also saves the tallies of the subtrees a few rolls below the
+    enumerated board. The race state is the board after the rolls that lead into the subtree, so after the
+    next observed dice rolls - or after a bet, which does not change the race at all - the next enumeration
+    is answered straight from the cache.
+
+    Simulation keys the cache by the canonical race state with the outcomes of the canonically relabelled
+    board (see symmetry.canonical_race_state), so boards differing only in the camel colours share an entry.
+    """
+
+    def __init__(self, max_entries: int = 20000, depth: int = 2):
+        """Subtree cache constructor.
+
+        Args:
+            max_entries: maximal number of saved subtrees, the least recently used ones are dropped
+            depth: number of rolls below the enumerated board down to which the subtrees are saved
+        """
+        self.max_entries = max_entries
+        self.depth = depth
+        self.stats = {'hits': 0, 'misses': 0}
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, race_state: Tuple) -> Union[Dict[Tuple[str], int], None]:
+        """Get the saved etape outcomes of a race state.
+
+        Args:
+            race_state: race state (see Board.race_state)
+
+        Returns:
+            camel order -> number of occurrences (must not be modified), None if the race state is not saved
+        """
+        outcomes = self._entries.get(race_state)
+        if outcomes is None:
+            self.stats['misses'] += 1
+            return None
+        self._entries.move_to_end(race_state)
+        self.stats['hits'] += 1
+        return outcomes
+
+    def put(self, race_state: Tuple, outcomes: Dict[Tuple[str], int]) -> None:
+        """Save the etape outcomes of a race state.
+
+        Args:
+            race_state: race state (see Board.race_state)
+            outcomes: camel order -> number of occurrences
+        """
+        self._entries[race_state] = dict(outcomes)
+        self._entries.move_to_end(race_state)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all the saved subtrees."""
+        self._entries.clear()
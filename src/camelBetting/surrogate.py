@@ -0,0 +1,223 @@
+"""Module containing the surrogate model of the overall winner and loser probabilities."""
+from camelBetting.entities.board import Board, CAMELS
+from camelBetting.features import board_features, N_FIELDS
+
+import os
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'data', 'surrogate.npz')
+N_CAMELS = len(CAMELS)
+
+
+def camel_features(features: np.ndarray) -> np.ndarray:
+    """Camel-centric features computed from the race features (see features.board_features).
+
+    The features do not depend on the camel colours, so one weight vector is shared by all the camels.
+
+    Args:
+        features: race features, shape (n, FEATURE_SIZE)
+
+    Returns:
+        camel features, shape (n, number of camels, number of camel features)
+    """
+    features = np.asarray(features, dtype=np.float64)
+    fields = features[:, 0:3 * N_CAMELS:3]
+    heights = features[:, 1:3 * N_CAMELS:3]
+    to_roll = features[:, 2:3 * N_CAMELS:3]
+    stones = features[:, 3 * N_CAMELS:3 * N_CAMELS + N_FIELDS]
+
+    leader = fields.max(axis=1, keepdims=True)
+    phase = leader / 16
+    n_to_roll = to_roll.sum(axis=1, keepdims=True) / N_CAMELS
+    relative = (fields - leader) / 4
+    same_field = fields[:, :, None] == fields[:, None, :]
+    above = (same_field & (heights[:, None, :] > heights[:, :, None])).sum(axis=2)
+    below = (same_field & (heights[:, None, :] < heights[:, :, None])).sum(axis=2)
+    carriers = (same_field & (heights[:, None, :] <= heights[:, :, None]) & (to_roll[:, None, :] > 0)).sum(axis=2)
+    ahead = (fields[:, :, None] > fields[:, None, :]) | (same_field & (heights[:, :, None] > heights[:, None, :]))
+    rank = N_CAMELS - 1 - ahead.sum(axis=2)  # 0 is the leading camel
+
+    stones_ahead = np.zeros(fields.shape + (2,))
+    for step in [1, 2, 3]:
+        field_index = np.clip(fields + step, 0, N_FIELDS - 1).astype(int)
+        values = np.take_along_axis(stones, field_index, axis=1) * (fields + step < N_FIELDS)
+        stones_ahead[:, :, 0] += values > 0
+        stones_ahead[:, :, 1] += values < 0
+
+    columns = [
+        relative, relative * phase, relative * n_to_roll,
+        rank / N_CAMELS, rank * phase / N_CAMELS, rank == 0, rank == N_CAMELS - 1,
+        above, above * n_to_roll, below, carriers, carriers * phase, to_roll,
+        stones_ahead[:, :, 0], stones_ahead[:, :, 1],
+    ]
+    return np.stack([np.broadcast_to(column, fields.shape) for column in columns], axis=2).astype(np.float64)
+
+
+def _softmax(scores: np.ndarray) -> np.ndarray:
+    """Softmax over the camels."""
+    scores = scores - scores.max(axis=1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def _fit_softmax(x: np.ndarray, y: np.ndarray, ridge: float = 1e-3, iterations: int = 30) -> np.ndarray:
+    """Fit the shared-weight softmax regression on soft labels by Newton's method.
+
+    Args:
+        x: camel features, shape (n, camels, features)
+        y: probabilities of the camels, shape (n, camels)
+        ridge: L2 regularisation
+        iterations: number of Newton steps
+
+    Returns:
+        weights, shape (features,)
+    """
+    n, _, n_features = x.shape
+    weights = np.zeros(n_features)
+    for _ in range(iterations):
+        p = _softmax(x @ weights)
+        gradient = np.einsum('nc,ncf->f', p - y, x) / n + ridge * weights
+        mean_x = np.einsum('nc,ncf->nf', p, x)
+        hessian = (np.einsum('nc,ncf,ncg->fg', p, x, x) - np.einsum('nf,ng->fg', mean_x, mean_x)) / n
+        hessian += ridge * np.eye(n_features)
+        step = np.linalg.solve(hessian, gradient)
+        weights -= step
+        if np.abs(step).max() < 1e-8:
+            break
+    return weights
+
+
+class SurrogateModel:
+    """Softmax model of the overall winner and loser probabilities fitted on simulated positions."""
+
+    def __init__(self, win_weights: np.ndarray, lose_weights: np.ndarray, error_by_leader_field: np.ndarray):
+        """Surrogate model constructor.
+
+        Args:
+            win_weights: weights of the winner model
+            lose_weights: weights of the loser model
+            error_by_leader_field: validation mean absolute error of the probabilities by the leading camel field
+        """
+        self.win_weights = win_weights
+        self.lose_weights = lose_weights
+        self.error_by_leader_field = error_by_leader_field
+
+    @classmethod
+    def fit(cls, features: np.ndarray, labels: np.ndarray, validation_share: float = 0.2) -> 'SurrogateModel':
+        """Fit the model on a dataset (see dataset.generate_dataset).
+
+        Args:
+            features: race features
+            labels: rank probabilities
+            validation_share: share of the positions used to estimate the error
+
+        Returns:
+            fitted model
+        """
+        x = camel_features(features)
+        labels = np.asarray(labels, dtype=np.float64).reshape(-1, N_CAMELS, N_CAMELS)
+        win, lose = labels[:, :, 0], labels[:, :, -1]
+        n_train = int(len(x) * (1 - validation_share))
+        model = cls(_fit_softmax(x[:n_train], win[:n_train]), _fit_softmax(x[:n_train], lose[:n_train]),
+                    np.ones(N_FIELDS + 4))
+        win_prediction, lose_prediction = model._predict(x[n_train:])
+        errors = np.maximum(np.abs(win_prediction - win[n_train:]).mean(axis=1),
+                            np.abs(lose_prediction - lose[n_train:]).mean(axis=1))
+        leader_fields = np.clip(np.asarray(features)[n_train:, 0:3 * N_CAMELS:3].max(axis=1), 0, N_FIELDS + 3)
+        observed = np.zeros(len(model.error_by_leader_field), dtype=bool)
+        for field in range(len(model.error_by_leader_field)):
+            field_errors = errors[leader_fields.astype(int) == field]
+            if len(field_errors) > 0:
+                model.error_by_leader_field[field] = field_errors.mean()
+                observed[field] = True
+        # fields without validation positions get the worst observed error
+        model.error_by_leader_field[~observed] = model.error_by_leader_field[observed].max()
+        return model
+
+    def save(self, path: str = DEFAULT_MODEL_PATH) -> None:
+        """Save the model.
+
+        Args:
+            path: path of the .npz file
+        """
+        np.savez(path, win_weights=self.win_weights, lose_weights=self.lose_weights,
+                 error_by_leader_field=self.error_by_leader_field)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_MODEL_PATH) -> 'SurrogateModel':
+        """Load a saved model.
+
+        Args:
+            path: path of the .npz file
+
+        Returns:
+            loaded model
+        """
+        with np.load(path) as data:
+            return cls(data['win_weights'], data['lose_weights'], data['error_by_leader_field'])
+
+    def _predict(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Winner and loser probabilities from camel features."""
+        return _softmax(x @ self.win_weights), _softmax(x @ self.lose_weights)
+
+    def error(self, board: Board) -> float:
+        """Expected error of the predicted probabilities for the board.
+
+        Args:
+            board: board to predict
+
+        Returns:
+            validation mean absolute error of the probabilities for positions with the same leading camel field
+        """
+        leader_field = max([f for f, i in board.camel_positions.values()])
+        return float(self.error_by_leader_field[min(max(leader_field, 0), len(self.error_by_leader_field) - 1)])
+
+    def predict(self, board: Board) -> Tuple[Dict[str, float], Dict[str, float]]:
+        """Predict the overall winner and loser probabilities.
+
+        Args:
+            board: board to predict
+
+        Returns:
+            camel -> winner probability, camel -> loser probability
+        """
+        win, lose = self._predict(camel_features(board_features(board)[None, :]))
+        return dict(zip(CAMELS, win[0].tolist())), dict(zip(CAMELS, lose[0].tolist()))
+
+
+def fit_surrogate(dataset_paths: List[str], path: str = DEFAULT_MODEL_PATH, seed: int = 0) -> SurrogateModel:
+    """Fit the surrogate model on generated datasets and save it.
+
+    Args:
+        dataset_paths: directories of the datasets (see dataset.generate_dataset)
+        path: path to save the model to
+        seed: seed of the train/validation split
+
+    Returns:
+        fitted model
+    """
+    features = np.concatenate([np.load(os.path.join(dataset_path, 'features.npy')) for dataset_path in dataset_paths])
+    labels = np.concatenate([np.load(os.path.join(dataset_path, 'labels.npy')) for dataset_path in dataset_paths])
+    permutation = np.random.RandomState(seed).permutation(len(features))
+    model = SurrogateModel.fit(features[permutation], labels[permutation])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    model.save(path)
+    return model
+
+
+_default_model: List[SurrogateModel] = []
+
+
+def default_surrogate() -> Union[SurrogateModel, None]:
+    """Get the surrogate model shipped with the package.
+
+    Returns:
+        the model or None if it is missing
+    """
+    if len(_default_model) == 0:
+        if not os.path.exists(DEFAULT_MODEL_PATH):
+            return None
+        _default_model.append(SurrogateModel.load())
+    return _default_model[0]
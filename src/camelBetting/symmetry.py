@@ -0,0 +1,62 @@
+"""Module containing the canonical relabelling of the camels - the race rules treat all the camels the same."""
+from camelBetting.entities.board import Board, CAMELS
+
+from typing import Dict, Tuple
+
+
+def canonical_labels(board: Board) -> Dict[str, str]:
+    """Relabelling of the camels to the canonical ones - the i-th camel in the current order gets CAMELS[i].
+
+    Boards with the same stacks, stones and camels left to roll up to the camel colours get the same canonical
+    race state. The relabelling keeps the order of the camels on the start, which is the order of CAMELS.
+
+    Args:
+        board: board to relabel
+
+    Returns:
+        camel -> canonical camel
+    """
+    return {camel: CAMELS[i] for i, camel in enumerate(board.current_camel_order)}
+
+
+def canonical_race_state(board: Board) -> Tuple[Tuple, Dict[str, str]]:
+    """Race state of the canonically relabelled board (see Board.race_state).
+
+    Args:
+        board: board to relabel
+
+    Returns:
+        canonical race state, camel -> canonical camel
+    """
+    labels = canonical_labels(board)
+    order = list(labels.keys())  # the current camel order
+    return (
+        tuple([board.camel_positions[camel] for camel in order]),
+        tuple(sorted([(field, stone.value) for field, stone in board.stones.items()])),
+        tuple([labels[camel] for camel in order if camel in board.camels_to_roll]),
+    ), labels
+
+
+def relabel_outcomes(outcomes: Dict[Tuple[str], int], labels: Dict[str, str]) -> Dict[Tuple[str], int]:
+    """Relabel the camels in the camel orders of outcomes.
+
+    Args:
+        outcomes: camel order -> number of occurrences
+        labels: camel -> new camel
+
+    Returns:
+        relabelled camel order -> number of occurrences
+    """
+    return {tuple([labels[camel] for camel in order]): n for order, n in outcomes.items()}
+
+
+def inverse_labels(labels: Dict[str, str]) -> Dict[str, str]:
+    """Inverse relabelling.
+
+    Args:
+        labels: camel -> new camel
+
+    Returns:
+        new camel -> camel
+    """
+    return {new: camel for camel, new in labels.items()}
@@ -1,18 +1,44 @@
 """Module containing various tests for the game entities."""
 import random
 
-from camelBetting.entities.board import Board
+from camelBetting.entities.board import Board, CAMELS, SHARED_FIELDS
 from camelBetting.entities.move import DiceRoll, StonePut
+from camelBetting.entities.stone import Stone
 from camelBetting.simulation import Simulation
 from camelBetting.game import Game
-from camelBetting.entities.player import EvilNpc, RandomNpc, LessRandomNpc, AdequateNpc, RollerNpc, HumanPlayer
+from camelBetting.entities.player import EvilNpc, RandomNpc, LessRandomNpc, AdequateNpc, RollerNpc, HumanPlayer, \
+    ExpectimaxNpc
+from camelBetting.entities.move_generators import possible_game_moves, simulation_moves
+from camelBetting.service import AnalysisService
+from camelBetting.sampling import StratifiedSampler, winner_spread
+from camelBetting.subtree_cache import SubtreeCache
+from camelBetting.lockstep import LockstepDriver
+from camelBetting.expectimax import ExpectimaxSearch
+from camelBetting.dataset import generate_dataset, generate_chunk, load_dataset, self_play_positions
+from camelBetting.surrogate import SurrogateModel, fit_surrogate
+from camelBetting.outcome_store import OutcomeStore
+from camelBetting.rollout_policies import RollOnlyPolicy, StonePlacerPolicy, MixedPolicy, play_action
+from camelBetting.tools import block_stdout, enable_stdout
 
+import copy
+import json
+import os
+import tempfile
 import time
+import asyncio
 from collections import defaultdict
 import numpy as np
 import cProfile
 
 
+def winner_probabilities(outcomes):
+    n = sum(outcomes.values())
+    winners = defaultdict(int)
+    for order, count in outcomes.items():
+        winners[order[0]] += count
+    return {camel: round(count / n, 3) for camel, count in sorted(winners.items())}
+
+
 def test_board_moves():
     pl = 'a'
     init_board = Board([pl])
@@ -42,6 +68,57 @@ def test_board_moves():
     print(board)
 
 
+def board_snapshot(board):
+    """Deep snapshot of the board contents."""
+    def plain(value):
+        if isinstance(value, dict):
+            return {key: plain(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [plain(item) for item in value]
+        if hasattr(value, '__dict__'):
+            return plain(vars(value))
+        return value
+    return board.position_key, plain([getattr(board, field) for field in SHARED_FIELDS])
+
+
+def test_board_versions():
+    random.seed(0)
+    players = [RandomNpc('a', threshold_for_overall_bets=8), LessRandomNpc('b', threshold_for_overall_bets=8),
+               RollerNpc('c')]
+    game = Game(players)
+    snapshots = [board_snapshot(game.board)]
+    block_stdout()
+    while not game.board.game_ended:
+        game.step()
+        snapshots.append(board_snapshot(game.board))
+    enable_stdout()
+    # the later moves did not change the earlier boards
+    assert [board_snapshot(board) for board in game.history] == snapshots
+
+    # replaying every move on the board before it gives the board after it
+    for before, move, after in game.replay():
+        move = copy.copy(move)
+        move.board = before
+        board = move.play(True)
+        if board.etape_ended:
+            board.reset_etape()
+        assert board_snapshot(board) == board_snapshot(after)
+
+    final_key = game.board.position_key
+    undone = game.moves[-10:]
+    game.undo(10)
+    assert [board_snapshot(board) for board in game.history] == snapshots[:-10]
+    block_stdout()
+    for move in undone:
+        move = copy.copy(move)
+        move.board = game.board
+        game.step(move)
+    enable_stdout()
+    assert game.board.position_key == final_key
+    assert [board_snapshot(board) for board in game.history[:-10]] == snapshots[:-10]
+    print(f'{len(game.moves)} moves, all the board versions unchanged')
+
+
 def test_simulation():
     board = Board(['a', 'b'])
     for i, camel in enumerate(board.camel_positions.keys()):
@@ -54,6 +131,98 @@ def test_simulation():
     print(sum(outcomes.values()))
 
 
+def random_race_board(rng, max_rolls=4):
+    """Random board with stacks, stones and camels on the start field."""
+    board = Board(['a', 'b'])
+    low = rng.choice([0, 0, 6, 11])
+    heights = defaultdict(int)
+    positions = {}
+    for camel in CAMELS:
+        field = rng.randint(low, min(low + 5, 16))
+        positions[camel] = (field, 0 if field == 0 else heights[field])
+        heights[field] += 1
+    board.camel_positions = positions
+    stones = {}
+    for _ in range(rng.randint(0, 3)):
+        field = rng.randint(2, 16)
+        if not any([f in stones for f in [field - 1, field, field + 1]]):
+            stones[field] = Stone(rng.choice(board.players), rng.random() < 0.5)
+    board.stones = stones
+    board.camels_to_roll = rng.sample(CAMELS, rng.randint(1, max_rolls))
+    return board
+
+
+def plain_etape(board, outcomes):
+    """Etape enumeration without any pruning."""
+    for move in simulation_moves(board):
+        new_board = move.play(True)
+        if new_board.etape_ended:
+            outcomes[new_board.current_camel_order] += 1
+        else:
+            plain_etape(new_board, outcomes)
+    return outcomes
+
+
+def plain_game(board, outcomes, etape_limit):
+    """Game enumeration without any pruning."""
+    for move in simulation_moves(board):
+        new_board = move.play(True)
+        if new_board.etape_ended:
+            new_board.reset_etape(simulation=True)
+        if new_board.game_ended:
+            outcomes[new_board.current_camel_order] += 1
+        elif new_board.etape >= etape_limit:
+            outcomes['?'] += 1
+        else:
+            plain_game(new_board, outcomes, etape_limit)
+    return outcomes
+
+
+def test_pruning():
+    # a stack next to a minus stone - the top camel rolling 1 falls under the camels below it
+    board = Board(['a', 'b'])
+    board.camel_positions.update({'white': (10, 0), 'yellow': (3, 1), 'blue': (3, 0)})
+    board.stones = {4: Stone('a', False)}
+    board.camels_to_roll = ['yellow', 'white']
+    rng = random.Random(0)
+    for board in [board] + [random_race_board(rng) for _ in range(300)]:
+        assert Simulation(board).simulate_etape() == plain_etape(board.copy(simulation=True), defaultdict(int))
+    for _ in range(120):
+        board = random_race_board(rng, max_rolls=3)
+        outcomes = Simulation(board).simulate_game(1)
+        assert outcomes == plain_game(board.copy(simulation=True), defaultdict(int), board.etape + 1)
+    print('pruned enumerations match the plain ones')
+
+
+def recolour(board, rng):
+    """Copy of the board with the camel colours permuted."""
+    colours = dict(zip(CAMELS, rng.sample(CAMELS, len(CAMELS))))
+    new_board = board.copy(simulation=True)
+    new_board.camel_positions = {colours[camel]: position for camel, position in board.camel_positions.items()}
+    new_board.camels_to_roll = [colours[camel] for camel in board.camels_to_roll]
+    return new_board
+
+
+def test_symmetry():
+    # several camels on the start, their ties are broken by the colours
+    board = Board(['a', 'b'])
+    board.camel_positions.update({'white': (4, 0), 'orange': (2, 0)})
+    board.camels_to_roll = ['yellow', 'green', 'white']
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        store = OutcomeStore(os.path.join(directory, 'outcomes.bin'))
+        for board in [board] + [random_race_board(rng, max_rolls=3) for _ in range(80)]:
+            cache = SubtreeCache()
+            Simulation(board, store, subtree_cache=cache).simulate_etape()
+            for _ in range(3):
+                other_board = recolour(board, rng)
+                expected = plain_etape(other_board.copy(simulation=True), defaultdict(int))
+                assert Simulation(other_board, subtree_cache=cache).cached_etape() == expected
+                assert Simulation(other_board, store).cached_etape() == expected
+        store.close()
+    print('recoloured boards match the plain enumeration')
+
+
 def test_approximation():
     board = Board(['a', 'b'])
     for i, camel in enumerate(board.camel_positions.keys()):
@@ -73,6 +242,272 @@ def test_approximation():
     # print(sum(outcomes.values()))
 
 
+def test_parallel_approximation():
+    board = Board(['a', 'b'])
+    for i, camel in enumerate(board.camel_positions.keys()):
+        board.camel_positions[camel] = (10, i)
+    for backend in ['thread', 'process']:
+        s = time.time()
+        outcomes = Simulation(board, rng=random.Random(0)).parallel_approximate_game(5000, 4, backend)
+        print(f'{backend}: {time.time() - s:.2f} s')
+    assert outcomes == Simulation(board, rng=random.Random(0)).parallel_approximate_game(5000, 4, 'thread')
+
+
+def test_subtree_cache():
+    cache = SubtreeCache()
+    board = Board(['a', 'b'])
+    s = time.time()
+    Simulation(board, subtree_cache=cache).simulate_etape()
+    print(f'etape: {time.time() - s:.2f} s')
+    board = DiceRoll(board, 'a', 'green', 2).play()
+    s = time.time()
+    outcomes = Simulation(board, subtree_cache=cache).simulate_etape()
+    print(f'etape after the roll: {time.time() - s:.4f} s, {cache.stats}')
+    assert outcomes == Simulation(board).simulate_etape()
+
+
+def test_move_budget():
+    board = Board(['a', 'b'])
+    for camel, dice in [('yellow', 3), ('blue', 3), ('green', 3), ('orange', 2), ('white', 3)]:
+        board = DiceRoll(board, board.current_player, camel, dice).play()
+    board.reset_etape()
+    board = StonePut(board, board.current_player, 6, True).play()
+    board = StonePut(board, board.current_player, 8, False).play()
+    for budget in [1.0, 0.1, 0.01]:
+        player = EvilNpc(board.current_player, threshold_for_overall_bets=3, game_approx_number=5000,
+                         move_budget=budget)
+        s = time.time()
+        move = player.choose_move(possible_game_moves(board, player.name), board)
+        print(f'budget {budget} s: {move} in {time.time() - s:.3f} s, engines: {player.last_engines}')
+
+
+def test_samplers():
+    board = Board(['a', 'b'])
+    board.camel_positions.update({'yellow': (14, 0), 'blue': (14, 1), 'green': (13, 0), 'orange': (12, 0),
+                                  'white': (11, 0)})
+    other_board = StonePut(board, 'a', 16, False).play()
+    # the rollout saving is the ratio of the variances - small for a single board, large for a comparison
+    for n in [100, 400]:
+        independent = winner_spread(board, lambda: None, n, 40)
+        stratified = winner_spread(board, StratifiedSampler, n, 40)
+        print(f'{n} rollouts, winner probability spread: independent {independent:.4f}, '
+              f'stratified {stratified:.4f} ({(independent / stratified) ** 2:.1f}x fewer rollouts)')
+        independent = winner_spread(board, lambda: None, n, 40, other_board)
+        stratified = winner_spread(board, StratifiedSampler, n, 40, other_board)
+        print(f'{n} rollouts, spread of the difference to a board with a stone: independent {independent:.4f}, '
+              f'stratified {stratified:.4f} ({(independent / stratified) ** 2:.1f}x fewer rollouts)')
+
+    # the stratified variance is below the plain Monte Carlo one for every seed, by far for the comparison
+    paired_gains = []
+    for seed in range(5):
+        random.seed(seed)
+        assert winner_spread(board, StratifiedSampler, 100, 40) < winner_spread(board, lambda: None, 100, 40)
+        independent = winner_spread(board, lambda: None, 100, 40, other_board)
+        stratified = winner_spread(board, StratifiedSampler, 100, 40, other_board)
+        assert stratified < independent
+        paired_gains.append((independent / stratified) ** 2)
+    assert sum(paired_gains) / len(paired_gains) > 2
+
+
+def test_hybrid_game():
+    board = Board(['a', 'b'])
+    board.camel_positions.update({'green': (12, 0), 'white': (9, 0), 'yellow': (13, 0), 'orange': (14, 0),
+                                  'blue': (14, 1)})
+    board.camels_to_roll = ['yellow']
+    board.stones = {11: Stone('a', True), 15: Stone('b', False)}
+    n = 20000
+    reference = winner_probabilities(Simulation(board, rng=random.Random(0)).approximate_game(n))
+    for name, sampler in [('independent', None), ('stratified', StratifiedSampler(1))]:
+        probabilities = winner_probabilities(Simulation(board, rng=random.Random(1)).hybrid_game(n, sampler))
+        print(f'{name}: {probabilities}, approximate_game: {reference}')
+        for camel in board.camel_positions.keys():
+            assert abs(probabilities[camel] - reference[camel]) < 0.02
+
+
+def test_rollout_policies():
+    board = Board(['a', 'b', 'c'])
+    for camel, dice in [('yellow', 3), ('blue', 3), ('green', 2), ('orange', 1), ('white', 3)]:
+        board = DiceRoll(board, board.current_player, camel, dice).play()
+    board.reset_etape()
+    policies = {
+        'baseline': None,
+        'roll only': RollOnlyPolicy(),
+        'stone placer': StonePlacerPolicy(),
+        'stone placer with bets': StonePlacerPolicy(bet_share=0.5),
+        'mixed': MixedPolicy([RollOnlyPolicy(), StonePlacerPolicy(['b', 'c'])], [0.5, 0.5]),
+    }
+    n = 2000
+    stones, current_player = dict(board.stones), board.current_player
+    probabilities = {}
+    for name, policy in policies.items():
+        simulation = Simulation(board, rng=random.Random(0), rollout_policy=policy)
+        s = time.time()
+        outcomes = simulation.approximate_game(n)
+        elapsed = time.time() - s
+        # every rollout finishes its game with a full camel order and the starting board is left untouched
+        assert sum(outcomes.values()) == n
+        assert all([sorted(order) == sorted(CAMELS) for order in outcomes.keys()])
+        assert board.stones == stones and board.current_player == current_player
+        probabilities[name] = winner_probabilities(outcomes)
+        print(f'{name}: {n / elapsed:.0f} rollouts/s, winners: '
+              f'{ {camel: round(p, 3) for camel, p in sorted(probabilities[name].items())} }')
+
+    # the roll only players draw the same rolls as the plain rollouts, with another seed it is the same game
+    # within the Monte Carlo error
+    assert probabilities['roll only'] == probabilities['baseline']
+    other_seed = winner_probabilities(
+        Simulation(board, rng=random.Random(1), rollout_policy=RollOnlyPolicy()).approximate_game(n))
+    assert all([abs(other_seed.get(camel, 0) - probabilities['baseline'].get(camel, 0)) < 0.05
+                for camel in CAMELS])
+
+    # the stone put actions are played like the stone puts, the actions of the stone placer are available
+    rng = random.Random(0)
+    policy = StonePlacerPolicy()
+    for _ in range(20):
+        race_board = random_race_board(rng)
+        action = policy.next_action(race_board, rng)
+        assert action is None or StonePut(race_board, race_board.current_player, *action).available
+        for field in range(2, 17):
+            move = StonePut(race_board, race_board.current_player, field, rng.random() < 0.5)
+            if move.available:
+                expected = move.play(True)
+                played = race_board.copy(simulation=True)
+                play_action(played, (field, move.positive))
+                assert {f: (stone.player, stone.value) for f, stone in played.stones.items()} == \
+                       {f: (stone.player, stone.value) for f, stone in expected.stones.items()}
+                assert played.current_player == expected.current_player
+
+
+def test_surrogate():
+    model = SurrogateModel.load()
+    rng = random.Random(0)
+    block_stdout()
+    boards = self_play_positions(12, rng)
+    enable_stdout()
+    errors, bounds = [], []
+    for board in boards:
+        win_probs, lose_probs = model.predict(board)
+        assert abs(sum(win_probs.values()) - 1) < 1e-9 and abs(sum(lose_probs.values()) - 1) < 1e-9
+        outcomes = Simulation(board, rng=random.Random(1)).approximate_game(4000)
+        n = sum(outcomes.values())
+        error = max(
+            np.mean([abs(win_probs[camel] - sum([k for order, k in outcomes.items() if order[0] == camel]) / n)
+                     for camel in CAMELS]),
+            np.mean([abs(lose_probs[camel] - sum([k for order, k in outcomes.items() if order[-1] == camel]) / n)
+                     for camel in CAMELS]),
+        )
+        # the stored error is a mean over the validation positions, single boards scatter around it
+        assert error <= 2 * model.error(board)
+        errors.append(error)
+        bounds.append(model.error(board))
+    print(f'mean error {np.mean(errors):.3f}, mean stored error {np.mean(bounds):.3f}')
+    assert np.mean(errors) <= 1.25 * np.mean(bounds)
+
+    with tempfile.TemporaryDirectory() as directory:
+        generate_dataset(os.path.join(directory, 'dataset'), 60, chunk_size=30, number_of_approximations=50,
+                         workers=1)
+        fitted = fit_surrogate([os.path.join(directory, 'dataset')], os.path.join(directory, 'surrogate.npz'))
+        loaded = SurrogateModel.load(os.path.join(directory, 'surrogate.npz'))
+        for board in boards:
+            assert fitted.predict(board) == loaded.predict(board)
+            assert abs(sum(loaded.predict(board)[0].values()) - 1) < 1e-9
+        assert np.array_equal(fitted.error_by_leader_field, loaded.error_by_leader_field)
+
+    # the NPCs fall back to the rollouts when the model is not accurate enough
+    board = Board(['a', 'b'])
+    for camel, dice in [('yellow', 3), ('blue', 3), ('green', 3), ('orange', 2), ('white', 3)]:
+        board = DiceRoll(board, board.current_player, camel, dice).play(True)
+    board.reset_etape(simulation=True)
+    board = StonePut(board, board.current_player, 6, True).play(True)
+    board = StonePut(board, board.current_player, 8, False).play(True)
+    for bound, game_approx_number, engine in [(1.0, 0, 'surrogate'), (0.0, 100, 'sampled')]:
+        player = EvilNpc(board.current_player, threshold_for_overall_bets=3, game_approx_number=100,
+                         surrogate_error_bound=bound)
+        request = player.request_evaluation(possible_game_moves(board, player.name), board)
+        assert request.game_approx_number == game_approx_number
+        player = EvilNpc(board.current_player, threshold_for_overall_bets=3, game_approx_number=100,
+                         surrogate_error_bound=bound, move_budget=1.0)
+        player.choose_move(possible_game_moves(board, player.name), board)
+        assert player.last_engines['game'] == engine
+    print('surrogate model within its error bounds')
+
+
+def plain_expectimax(search, board, depth):
+    """Expectimax value without any pruning, with the actions and the evaluation of the search."""
+    if depth == 0 or board.game_ended:
+        return search._evaluate(board)
+    values = []
+    for action in search._ordered_actions(board):
+        if action is None:
+            children = []
+            for camel in board.camels_to_roll:
+                for dice in [1, 2, 3]:
+                    child = DiceRoll(board, board.current_player, camel, dice).play()
+                    search._after_move(child)
+                    children.append(plain_expectimax(search, child, depth - 1))
+            values.append(sum(children) / len(children))
+        else:
+            child = action.play()
+            search._after_move(child)
+            values.append(plain_expectimax(search, child, depth - 1))
+    return max(values) if board.current_player == search.player else min(values)
+
+
+def test_expectimax():
+    board = Board(['a', 'b'])
+    for camel, dice in [('yellow', 2), ('blue', 1), ('green', 3)]:
+        board = DiceRoll(board, board.current_player, camel, dice).play()
+    player = ExpectimaxNpc(board.current_player, threshold_for_overall_bets=8, game_approx_number=5000,
+                           max_depth=4, time_limit=5)
+    move = player.choose_move(possible_game_moves(board, player.name), board)
+    print(move)
+    print(player.last_search_stats)
+
+    # the Star1/Star2 pruned value equals the plain expectimax value - at depth 2 the chance nodes below the
+    # root only have leaf children, the windows of the deeper chance nodes are checked at depth 3, on enough
+    # boards for the cut-offs to decide the value of some of them
+    rng = random.Random(0)
+    prunes = 0
+    for board in [board] + [random_race_board(rng) for _ in range(30)]:
+        for depth in [2, 3]:
+            search = ExpectimaxSearch(board.current_player, max_depth=depth, value_bound=5)
+            best_shortcut, best_value = search.search(board)
+            assert abs(best_value - plain_expectimax(search, board.copy(simulation=True), depth)) < 1e-9
+            prunes += search.stats['star1_prunes'] + search.stats['star2_prunes']
+    assert prunes > 0
+
+
+def test_service():
+    boards = [Board(['a', 'b'])]
+    boards.append(DiceRoll(boards[0], 'a', 'yellow', 2).play())
+
+    async def run():
+        async with AnalysisService(max_workers=2) as service:
+            results = await asyncio.gather(*[service.analyse(boards[i % 2]) for i in range(20)])
+            print(service.stats)
+        return results
+
+    results = asyncio.run(run())
+    assert results[0] == results[2] and results[1] == results[3]
+    print(results[0][:5])
+    print(results[1][:5])
+
+
+def test_lockstep():
+    games = [Game([
+        EvilNpc('Evil Guy', threshold_for_overall_bets=8, game_approx_number=1000),
+        AdequateNpc('Adequate Guy', threshold_for_overall_bets=8, game_approx_number=1000, n_top_moves=3),
+        RollerNpc('High Roller'),
+    ]) for _ in range(16)]
+    driver = LockstepDriver(games)
+    s = time.time()
+    block_stdout()
+    driver.play()
+    enable_stdout()
+    print(f'{len(games)} games in {time.time() - s:.1f} s, {driver.stats}')
+    assert all([game.board.game_ended for game in games])
+
+
 def npc_battle():
     players = [
         RandomNpc('Silly Guy', threshold_for_overall_bets=8),
@@ -101,6 +536,38 @@ def npc_battle():
     print(dict(winners))
 
 
+def test_dataset_resume():
+    with tempfile.TemporaryDirectory() as directory:
+        full_path = os.path.join(directory, 'full')
+        generate_dataset(full_path, 12, chunk_size=6, number_of_approximations=20, workers=1, seed=3)
+
+        # interrupted after the first chunk - the second one is missing from the progress and the files
+        resumed_path = os.path.join(directory, 'resumed')
+        generate_dataset(resumed_path, 12, chunk_size=6, number_of_approximations=20, workers=1, seed=3)
+        with open(os.path.join(resumed_path, 'progress.json')) as f:
+            progress = json.load(f)
+        progress['done'].remove(1)
+        with open(os.path.join(resumed_path, 'progress.json'), 'w') as f:
+            json.dump(progress, f)
+        for name in ['features.npy', 'labels.npy']:
+            rows = np.load(os.path.join(resumed_path, name), mmap_mode='r+')
+            rows[6:] = 0
+            rows.flush()
+            del rows
+        random.random()  # other users of the global generator between the runs
+        generate_dataset(resumed_path, 12, chunk_size=6, number_of_approximations=20, workers=1, seed=3)
+
+        for full, resumed in zip(load_dataset(full_path), load_dataset(resumed_path)):
+            assert np.array_equal(full, resumed)
+
+    # a chunk does not touch the global generator
+    state = random.getstate()
+    generate_chunk(0, 6, 'random', 20, 3)
+    enable_stdout()
+    assert random.getstate() == state
+    print('resumed dataset matches the uninterrupted one')
+
+
 def test_game():
     players = [
         LessRandomNpc('Less Random Guy', threshold_for_overall_bets=8),
@@ -115,8 +582,22 @@ def test_game():
 def main():
     s = time.time()
     # test_board_moves()
+    # test_board_versions()
     # test_simulation()
+    # test_pruning()
     # test_approximation()
+    # test_parallel_approximation()
+    # test_subtree_cache()
+    # test_symmetry()
+    # test_move_budget()
+    # test_samplers()
+    # test_hybrid_game()
+    # test_rollout_policies()
+    # test_surrogate()
+    # test_expectimax()
+    # test_service()
+    # test_lockstep()
+    # test_dataset_resume()
     # npc_battle()
     test_game()
     # cProfile.run('test_simulation()')
@@ -0,0 +1,81 @@
+"""Module containing the game rollouts of many boards vectorized with NumPy."""
+from camelBetting.entities.board import Board, CAMELS
+
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+N_CAMELS = len(CAMELS)
+N_LANDING_FIELDS = 21  # fields a camel can land on before the game ends - up to field 16 + 3 and a stone
+
+
+def approximate_games(
+        boards: List[Board], numbers_of_approximations: List[int], seed: Union[int, None] = None
+) -> List[Dict[Tuple[str], int]]:
+    """Approximate the game outcomes of many boards by random rollouts played together.
+
+    One roll of all the running rollouts of all the boards is one NumPy step, so the cost per rollout falls
+    with the number of rollouts in the batch. The rolls are drawn like in Simulation.approximate_game - a
+    uniformly random camel that has not rolled in the etape and a uniformly random dice - and moved by the
+    same rules as DiceRoll, stacks and stones included.
+
+    Args:
+        boards: boards to approximate
+        numbers_of_approximations: number of rollouts of each board
+        seed: seed of the random generator
+
+    Returns:
+        camel order at the end of the game -> number of rollouts, for each board
+    """
+    rng = np.random.default_rng(seed)
+    board_index = np.repeat(np.arange(len(boards)), numbers_of_approximations)
+    fields = np.array([[board.camel_positions[camel][0] for camel in CAMELS] for board in boards],
+                      dtype=np.int64).reshape(-1, N_CAMELS)[board_index]
+    heights = np.array([[board.camel_positions[camel][1] for camel in CAMELS] for board in boards],
+                       dtype=np.int64).reshape(-1, N_CAMELS)[board_index]
+    to_roll = np.array([[camel in board.camels_to_roll for camel in CAMELS] for board in boards],
+                       dtype=bool).reshape(-1, N_CAMELS)[board_index]
+    stones = np.zeros((len(boards), N_LANDING_FIELDS), dtype=np.int64)
+    for i, board in enumerate(boards):
+        for field, stone in board.stones.items():
+            stones[i, field] = stone.value
+
+    running = np.flatnonzero(~(fields > 16).any(axis=1))
+    while len(running) > 0:
+        f, h, m = fields[running], heights[running], to_roll[running]
+        rows = np.arange(len(running))
+        m[~m.any(axis=1)] = True  # a new etape
+        pick = (rng.random(len(running)) * m.sum(axis=1)).astype(np.int64)
+        camel = (np.cumsum(m, axis=1) > pick[:, None]).argmax(axis=1)
+        dice = rng.integers(1, 4, len(running))
+
+        field, height = f[rows, camel], h[rows, camel]
+        party = (f == field[:, None]) & (h >= height[:, None])
+        at_start = field == 0
+        party[at_start] = False  # the camels on the start move one by one
+        party[rows[at_start], camel[at_start]] = True
+        landing = field + dice
+        stone = stones[board_index[running], landing]
+        target = landing + stone
+        size = party.sum(axis=1)[:, None]
+        relative = h - height[:, None]
+        others = (f == target[:, None]) & ~party
+        on_top = (stone >= 0)[:, None]
+        # a party put under the camels of a field by a minus stone ends up reversed, see DiceRoll
+        party_heights = np.where(on_top, others.sum(axis=1)[:, None] + relative, size - 1 - relative)
+        h = np.where(party, party_heights, np.where(others & ~on_top, h + size, h))
+        f = np.where(party, target[:, None], f)
+        m[rows, camel] = False
+
+        fields[running], heights[running], to_roll[running] = f, h, m
+        running = running[~(f > 16).any(axis=1)]
+
+    # the current camel order, the camels on the start keep the order of CAMELS
+    orders = np.argsort(-(fields * (N_CAMELS + 1) + heights), axis=1, kind='stable')
+    codes = (orders * N_CAMELS ** np.arange(N_CAMELS)).sum(axis=1)
+    outcomes = [{} for _ in boards]
+    for i, n in zip(*np.unique(board_index * N_CAMELS ** N_CAMELS + codes, return_counts=True)):
+        code = i % N_CAMELS ** N_CAMELS
+        order = tuple([CAMELS[code // N_CAMELS ** j % N_CAMELS] for j in range(N_CAMELS)])
+        outcomes[i // N_CAMELS ** N_CAMELS][order] = int(n)
+    return outcomes